@@ -1,6 +1,8 @@
 import numpy as np
 import tensorflow as tf
 
+from ushiriki.infrastructure.utils import RolloutBatch
+
 class BaseAgent(object):
     def __init__(self, **kwargs):
         super(BaseAgent, self).__init__(**kwargs)
@@ -11,5 +13,17 @@ class BaseAgent(object):
     def add_to_replay_buffer(self, paths):
         raise NotImplementedError
 
+    def consume_stream(self, stream):
+        """
+            Add the rollouts of a stream (see utils.stream_trajectories)
+            to the replay buffer
+
+            returns a RolloutBatch of the rollouts and their number of steps
+        """
+        batch = RolloutBatch.from_paths(list(stream))
+        if len(batch):
+            self.add_to_replay_buffer(batch)
+        return batch, batch.num_steps
+
     def sample(self, batch_size):
         raise NotImplementedError
@@ -24,18 +24,47 @@ class BCAgent(BaseAgent):
                                self.agent_params['size'],
                                discrete = self.agent_params['discrete'],
                                learning_rate = self.agent_params['learning_rate'],
+                               seed = self.agent_params.get('seed'),
                                )
 
         # replay buffer
-        self.replay_buffer = ReplayBuffer(self.agent_params['max_replay_buffer_size'])
+        self.replay_buffer = ReplayBuffer(self.agent_params.get('max_replay_buffer_size', 1000000),
+                                          store=self.agent_params.get('rollout_store'))
+
+        # columnar expert dataset sampled instead of the replay buffer
+        self.expert_data = None
+        self._expert_batches = None
+        self._expert_batch_size = None
+
+    def set_expert_data(self, reader):
+        """
+            Train on an ExpertDataReader, read from disk a batch at a time,
+            rather than on the replay buffer
+        """
+        self.expert_data = reader
+        self._expert_batches = None
 
     def train(self, ob_no, ac_na, re_n, next_ob_no, terminal_n):
         # training a BC agent refers to updating its actor using
         # the given observations and corresponding action labels
-        self.actor.update(ob_no, ac_na)
+        return self.actor.update(ob_no, ac_na)
 
     def add_to_replay_buffer(self, paths):
         self.replay_buffer.add_rollouts(paths)
 
     def sample(self, batch_size):
+        if self.expert_data is not None:
+            return self._sample_expert_data(batch_size)
         return self.replay_buffer.sample_random_data(batch_size)
+
+    def _sample_expert_data(self, batch_size):
+        # shuffled passes over the dataset, a new order for every pass
+        while True:
+            if self._expert_batches is None or batch_size != self._expert_batch_size:
+                self._expert_batches = self.expert_data.iter_transitions(
+                    batch_size, shuffle=True, seed=np.random.randint(2 ** 31))
+                self._expert_batch_size = batch_size
+            batch = next(self._expert_batches, None)
+            if batch is not None:
+                return batch
+            self._expert_batches = None
@@ -4,6 +4,8 @@ from .base_agent import BaseAgent
 from ushiriki.policies.MLP_policy import MLPPolicyPG
 from ushiriki.infrastructure.replay_buffer import ReplayBuffer
 from ushiriki.infrastructure.utils import *
+from ushiriki.infrastructure import returns
+from ushiriki.infrastructure import profiler
 
 
 class PGAgent(BaseAgent):
@@ -20,6 +22,10 @@ class PGAgent(BaseAgent):
         self.reward_to_go = self.agent_params['reward_to_go']
         self.gae = self.agent_params.get('gae')
         self.lamda = self.agent_params['lambda']
+        self.joint_baseline_step = self.agent_params.get('joint_baseline_step', False)
+        # off-policy correction for rollouts of an older policy
+        self.behavior_policy = None
+        self.is_clip = self.agent_params.get('is_clip', 1.)
         # actor/policy
         # NOTICE that we are using MLPPolicyPG (hw2), instead of MLPPolicySL (hw1)
         # which indicates similar network structure (layout/inputs/outputs),
@@ -33,11 +39,21 @@ class PGAgent(BaseAgent):
                                  discrete=self.agent_params['discrete'],
                                  learning_rate=self.agent_params['learning_rate'],
                                  nn_baseline=self.agent_params['nn_baseline'],
-                                 gae=self.agent_params.get('gae', False)
+                                 gae=self.agent_params.get('gae', False),
+                                 joint_baseline_step=self.joint_baseline_step,
+                                 memoize_actions=self.agent_params.get('memoize_actions', False),
+                                 seed=self.agent_params.get('seed')
                                  )
 
         # replay buffer
-        self.replay_buffer = ReplayBuffer(1000000)
+        self.replay_buffer = ReplayBuffer(
+            1000000, store=self.agent_params.get('rollout_store'))
+
+        # q-values computed while streaming, reused by train when it gets
+        # the same episodes back from the buffer
+        self._streamed_q = []
+        self._streamed_total = None
+        self._sampled_q = None
 
     def train(self, obs, acs, rews_list, next_obs, terminals):
         """
@@ -62,22 +78,53 @@ class PGAgent(BaseAgent):
             ----------------------------------------------------------------------------------
         """
 
+        timer = profiler.timer
+
         if self.gae:
-            q_values, advantage_values = self.use_gae(
-                np.concatenate(rews_list), obs, terminals)
+            with timer.phase('train/gae'):
+                q_values, advantage_values = self.use_gae(
+                    np.concatenate(rews_list), obs, terminals)
 
         else:
             # step 1: calculate q values of each (s_t, a_t) point,
             # using rewards from that full rollout of length T: (r_0, ..., r_t, ..., r_{T-1})
-            q_values = self.calculate_q_vals(rews_list)
+            with timer.phase('train/q_values'):
+                if self._sampled_q is not None and len(self._sampled_q) == len(obs):
+                    q_values = self._sampled_q
+                else:
+                    q_values = self.calculate_q_vals(rews_list)
 
             # step 2: calculate advantages that correspond to each (s_t, a_t) point
-            advantage_values = self.estimate_advantage(obs, q_values)
-
-        loss = self.actor.update(
-            obs, acs, qvals=q_values, adv_n=advantage_values)
+            with timer.phase('train/advantages'):
+                advantage_values = self.estimate_advantage(obs, q_values)
+
+        # correct for data collected by an older version of the policy
+        if self.behavior_policy is not None:
+            with timer.phase('train/importance_weights'):
+                advantage_values = advantage_values * \
+                    self.importance_weights(obs, acs)
+
+        with timer.phase('train/update'):
+            loss = self.actor.update(
+                obs, acs, qvals=q_values, adv_n=advantage_values)
         return loss
 
+    def set_behavior_policy(self, policy):
+        """
+            Policy that collected the data passed to train (with a
+            `log_prob(obs, acs)` method), or None for on-policy data
+        """
+        self.behavior_policy = policy
+
+    def importance_weights(self, obs, acs):
+        """
+            Truncated importance weights min(pi(a|s) / mu(a|s), is_clip)
+            of the current policy pi over the behavior policy mu
+        """
+        log_ratio = self.actor.run_logprob(obs, acs) - \
+            self.behavior_policy.log_prob(obs, acs)
+        return np.minimum(np.exp(log_ratio), self.is_clip)
+
     def calculate_q_vals(self, rews_list):
         """
             Monte Carlo estimation of the Q function.
@@ -94,19 +141,20 @@ class PGAgent(BaseAgent):
 
         """
 
+        # all rollouts at once, as a padded [N, T] matrix
+        rewards, mask = returns.pad_rewards(rews_list)
+
         # Case 1: trajectory-based PG
         if not self.reward_to_go:
 
-            q_values = np.concatenate(
-                [self._discounted_return(r) for r in rews_list])
+            q_values = returns.discounted_returns(rewards, mask, self.gamma)
 
         # Case 2: reward-to-go PG
         else:
 
-            q_values = np.concatenate(
-                [self._discounted_cumsum(r) for r in rews_list])
+            q_values = returns.reward_to_go(rewards, mask, self.gamma)
 
-        return q_values
+        return returns.unpad(q_values, mask)
 
     def use_gae(self, rewards, obs, terminals):
         """
@@ -116,27 +164,10 @@ class PGAgent(BaseAgent):
             Adv = sigma[l=0: inf]([gamma * lambda] ^l * delta[t+1])
         """
         v_baseline = self.actor.run_baseline_prediction(obs)
-        rew_len = rewards.size
-        adv = np.zeros((rew_len,))
-
-        for t in reversed(range(rew_len)):
-            """
-            delta = rewards[t] + ((1 - terminals[t]) *
-                                  self.gamma * v_baseline[t+1]) - v_baseline[t]
-            adv[t] = self.gamma * self.lamda * adv[t+1] + delta
-
-            q_values = adv + v_baseline
 
-            return q_values, adv """
-
-            if terminals[t]:
-                delta = rewards[t] - v_baseline[t]
-                adv[t] = delta
-            else:
-                delta = rewards[t] + (1 - terminals[t]) * \
-                    self.gamma * v_baseline[t+1] - v_baseline[t]
-
-                adv[t] = delta + self.gamma * self.lamda * adv[t+1]
+        # all episodes at once, split at the terminal steps
+        adv = returns.gae(rewards, v_baseline, terminals,
+                          self.gamma, self.lamda)
         q_values = adv + v_baseline
 
         return q_values, adv
@@ -167,8 +198,40 @@ class PGAgent(BaseAgent):
     def add_to_replay_buffer(self, paths):
         self.replay_buffer.add_rollouts(paths)
 
+    def consume_stream(self, stream):
+        """
+            Insert streamed episodes into the replay buffer as they finish,
+            computing their q-values while the next ones are collected
+
+            Only plain Monte Carlo q-values are precomputed: GAE needs the
+            baseline.
+
+            returns a RolloutBatch of the episodes and their number of steps
+        """
+        precompute_q = not self.gae
+        paths = []
+        self._streamed_q = []
+        for path in stream:
+            self.replay_buffer.add_rollouts([path])
+            if precompute_q:
+                self._streamed_q.append(self.calculate_q_vals([path['reward']]))
+            paths.append(path)
+        self._streamed_total = self.replay_buffer.total_added
+
+        batch = RolloutBatch.from_paths(paths)
+        return batch, batch.num_steps
+
     def sample(self, batch_size):
-        return self.replay_buffer.sample_recent_data(batch_size, concat_rew=False)
+        data = self.replay_buffer.sample_recent_data(batch_size, concat_rew=False)
+
+        # the sampled episodes are the last streamed ones if nothing was
+        # added to the buffer since
+        n_episodes = len(data[2])
+        self._sampled_q = None
+        if (self._streamed_q and n_episodes <= len(self._streamed_q)
+                and self.replay_buffer.total_added == self._streamed_total):
+            self._sampled_q = np.concatenate(self._streamed_q[-n_episodes:])
+        return data
 
     #####################################################
     ################## HELPER FUNCTIONS #################
@@ -185,26 +248,8 @@ class PGAgent(BaseAgent):
                 because each index t is a sum from 0 to T-1 (and doesnt involve t)
         """
 
-        # 1) create a list of indices (t'): from 0 to T-1
-        rew_len = len(rewards)
-
-        indices = np.arange(rew_len)
-
-        # 2) create a list where the entry at each index (t') is gamma^(t')
-        discounts = np.power(self.gamma, indices)
-
-        # 3) create a list where the entry at each index (t') is gamma^(t') * r_{t'}
-        discounted_rewards = np.multiply(discounts, rewards)
-
-        # 4) calculate a scalar: sum_{t'=0}^{T-1} gamma^(t') * r_{t'}
-        sum_of_discounted_rewards = np.sum(discounted_rewards)
-
-        # 5) create a list of length T-1, where each entry t contains that scalar
-        # NOTE why entries are all similar
-        list_of_discounted_returns = np.full(
-            rew_len, sum_of_discounted_rewards)
-
-        return list_of_discounted_returns
+        rewards, mask = returns.pad_rewards([rewards])
+        return returns.discounted_returns(rewards, mask, self.gamma)[0]
 
     def _discounted_cumsum(self, rewards):
         """
@@ -216,28 +261,5 @@ class PGAgent(BaseAgent):
                 a list where the entry in each index t is sum_{t'=t}^{T-1} gamma^(t'-t) * r_{t'}
         """
 
-        all_discounted_cumsums = []
-        rew_len = len(rewards)
-
-        # for loop over steps (t) of the given rollout
-        for start_time_index in range(len(rewards)):
-
-            # 1) create a list of indices (t'): goes from t to T-1
-            indices = np.arange(start_time_index, rew_len)
-
-            # 2) create a list where the entry at each index (t') is gamma^(t'-t)
-            discounts = np.power(self.gamma, indices - start_time_index)
-
-            # 3) create a list where the entry at each index (t') is gamma^(t'-t) * r_{t'}
-            # Hint: remember that t' goes from t to T-1, so you should use the rewards from those indices as well
-            # np.multiply faster with arrays
-            discounted_rtg = np.multiply(
-                discounts, rewards[start_time_index:, ])
-
-            # 4) calculate a scalar: sum_{t'=t}^{T-1} gamma^(t'-t) * r_{t'}
-            sum_discounted_rtg = np.sum(discounted_rtg)
-
-            # appending each of these calculated sums into the list to return
-            all_discounted_cumsums.append(sum_discounted_rtg)
-        list_of_discounted_cumsums = np.asanyarray(all_discounted_cumsums)
-        return list_of_discounted_cumsums
+        rewards, mask = returns.pad_rewards([rewards])
+        return returns.reward_to_go(rewards, mask, self.gamma)[0]
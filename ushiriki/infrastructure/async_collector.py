@@ -0,0 +1,104 @@
+"""
+    Concurrent rollout collection against the hosted Ushiriki API
+"""
+import concurrent.futures
+import queue
+import threading
+
+from ushiriki.infrastructure.utils import RolloutBatch, sample_trajectory
+
+
+class _SerializedPolicy(object):
+    """
+        Policy queried by one collection thread at a time
+    """
+
+    def __init__(self, policy, lock):
+        self.policy = policy
+        self.lock = lock
+
+    def get_action(self, ob):
+        with self.lock:
+            return self.policy.get_action(ob)
+
+
+class AsyncRolloutCollector(object):
+    """
+        Runs many episodes concurrently, each on an env of its own
+
+        The envs come from `make_env(index)`, the trainer's constructor,
+        so requests are made by the policy engine library's own client
+        (ChallengeEnvironment), through the same reward cache, tracer and
+        evaluation budget as every other env of the run. Their blocking
+        requests run in a pool of `max_concurrency` threads, so that many
+        requests are in flight at any time. Envs are made on first use and
+        kept across training iterations.
+
+        The policy is queried by one thread at a time, as the policies'
+        sessions and random generators are not meant to be shared.
+    """
+
+    def __init__(self, make_env, max_concurrency=32, policy_dimension=5):
+        self.make_env = make_env
+        self.max_concurrency = max_concurrency
+        self.policy_dimension = policy_dimension
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency)
+        self._policy_lock = threading.Lock()
+        # envs not running an episode, and the number made so far
+        self._idle_envs = queue.Queue()
+        self._n_envs = 0
+        self._envs_lock = threading.Lock()
+
+    ##################################
+
+    def _acquire_env(self):
+        try:
+            return self._idle_envs.get_nowait()
+        except queue.Empty:
+            with self._envs_lock:
+                self._n_envs += 1
+                index = self._n_envs
+            return self.make_env(index)
+
+    def _sample_trajectory(self, policy, max_path_length):
+        env = self._acquire_env()
+        try:
+            return sample_trajectory(env, policy, max_path_length)
+        finally:
+            self._idle_envs.put(env)
+
+    ##################################
+
+    def sample_trajectories(self, policy, min_timesteps_per_batch, max_path_length):
+        """
+            Collect rollouts until we have collected min_timesteps_per_batch steps.
+
+            returns the same (paths, timesteps_this_batch) as utils.sample_trajectories
+        """
+        policy = _SerializedPolicy(policy, self._policy_lock)
+        ep_len = min(max_path_length, self.policy_dimension)
+        timesteps_this_batch = 0
+        paths = []
+        while timesteps_this_batch < min_timesteps_per_batch:
+            n_episodes = -(-(min_timesteps_per_batch - timesteps_this_batch)
+                           // ep_len)
+            futures = [self._executor.submit(self._sample_trajectory,
+                                             policy, max_path_length)
+                       for _ in range(n_episodes)]
+            try:
+                new_paths = [future.result() for future in futures]
+            except Exception:
+                # e.g. the evaluation budget is spent: start no more episodes
+                for future in futures:
+                    future.cancel()
+                raise
+
+            paths.extend(new_paths)
+            timesteps_this_batch += sum(len(p['reward']) for p in new_paths)
+
+        return RolloutBatch.from_paths(paths), timesteps_this_batch
+
+    def close(self):
+        self._executor.shutdown()
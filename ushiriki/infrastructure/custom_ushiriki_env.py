@@ -3,13 +3,9 @@
 """
 from ushiriki_policy_engine_library.DLI19ChallengeEnvironment \
     import ChallengeEnvironment
-from dataclasses import dataclass
 import numpy as np
 
-
-@dataclass
-class EnvData:
-    metadata = {'video.frames_per_second': 50}
+from .env_data import EnvData
 
 
 class CustomUshirikiEnvironment(ChallengeEnvironment):
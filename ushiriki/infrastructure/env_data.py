@@ -0,0 +1,12 @@
+"""
+    Gym-style metadata shared by the Ushiriki env backends
+
+    Kept apart from custom_ushiriki_env so the offline simulator does not
+    need the hosted-API client installed.
+"""
+from dataclasses import dataclass
+
+
+@dataclass
+class EnvData:
+    metadata = {'video.frames_per_second': 50}
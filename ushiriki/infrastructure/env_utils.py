@@ -0,0 +1,145 @@
+"""
+    Construction of Ushiriki envs from the trainer params
+"""
+import threading
+
+from .local_ushiriki_env import LocalUshirikiEnvironment
+from .reward_cache import CachedUshirikiEnvironment
+from .tracer import tracer
+
+
+class EvaluationBudget(object):
+    """
+        Evaluations spent by all the envs of a run
+
+        Each ChallengeEnvironment only enforces its own `experimentCount`,
+        so a run with several envs could spend that many evaluations per
+        env. Every request of every env built with this budget spends from
+        it, and with `limit` a request beyond it raises before being sent.
+        Without a limit, requests are only counted. The envs of rollout
+        worker processes have budgets of their own.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self):
+        return None if self.limit is None else self.limit - self.spent
+
+    def spend(self, n=1):
+        with self._lock:
+            if self.limit is not None and self.spent + n > self.limit:
+                raise ValueError(
+                    'The evaluation budget of {} is exceeded: {} spent, {} '
+                    'more requested'.format(self.limit, self.spent, n))
+            self.spent += n
+
+
+class BudgetedEnvironment(object):
+    """
+        Spends from an EvaluationBudget for every request to the wrapped env
+
+        Other attributes are read from, and written to, the wrapped env.
+    """
+
+    def __init__(self, base_env, budget):
+        object.__setattr__(self, 'base_env', base_env)
+        object.__setattr__(self, 'budget', budget)
+
+    def __getattr__(self, name):
+        return getattr(self.base_env, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.base_env, name, value)
+
+    def evaluateAction(self, action):
+        self.budget.spend()
+        return self.base_env.evaluateAction(action)
+
+    def step(self, action):
+        self.budget.spend()
+        return self.base_env.step(action)
+
+    def evaluatePolicy(self, data):
+        self.budget.spend(len(data) if isinstance(data, list) else 1)
+        return self.base_env.evaluatePolicy(data)
+
+    def evaluatePolicySteps(self, policies):
+        self.budget.spend(len(policies))
+        return self.base_env.evaluatePolicySteps(policies)
+
+
+def has_policy_steps(env):
+    """
+        Whether the innermost env of the wrappers gives per-year rewards of
+        whole policies (evaluatePolicySteps), as the local simulator does
+    """
+    while hasattr(env, 'base_env'):
+        env = env.base_env
+    return hasattr(env, 'evaluatePolicySteps')
+
+
+class TracedEnvironment(object):
+    """
+        Records a trace span for every request to the wrapped env
+
+        Other attributes are read from, and written to, the wrapped env,
+        so e.g. setting `state` on the wrapper moves the env itself.
+    """
+
+    def __init__(self, base_env):
+        object.__setattr__(self, 'base_env', base_env)
+
+    def __getattr__(self, name):
+        return getattr(self.base_env, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.base_env, name, value)
+
+    def evaluateAction(self, action):
+        with tracer.span('evaluateAction', 'env'):
+            return self.base_env.evaluateAction(action)
+
+    def step(self, action):
+        with tracer.span('evaluateAction', 'env'):
+            return self.base_env.step(action)
+
+    def evaluatePolicy(self, data):
+        n_policies = len(data) if isinstance(data, list) else 1
+        with tracer.span('evaluatePolicy', 'env', n_policies=n_policies):
+            return self.base_env.evaluatePolicy(data)
+
+    def evaluatePolicySteps(self, policies):
+        with tracer.span('evaluatePolicySteps', 'env', n_policies=len(policies)):
+            return self.base_env.evaluatePolicySteps(policies)
+
+
+def make_env(backend, env_creds, seed=0, reward_cache=None, budget=None):
+    """
+        Create an env on the given backend
+
+        backend: 'remote' for the hosted challenge API,
+            'local' for the in-process simulator
+        reward_cache: optional RewardCache to serve repeated queries from
+        budget: optional EvaluationBudget every request spends from
+    """
+    if backend == 'local':
+        # in-process simulator, no network calls
+        env = LocalUshirikiEnvironment(seed=seed, **env_creds)
+    else:
+        # the hosted-API client is only needed for this backend
+        from .custom_ushiriki_env import CustomUshirikiEnvironment
+        env = CustomUshirikiEnvironment(**env_creds)
+
+    # requests only, cache hits spend nothing and are not traced
+    if budget is not None:
+        env = BudgetedEnvironment(env, budget)
+    if tracer.enabled:
+        env = TracedEnvironment(env)
+
+    if reward_cache is not None:
+        env = CachedUshirikiEnvironment(env, reward_cache)
+    return env
@@ -0,0 +1,147 @@
+"""
+    Columnar on-disk format for expert rollouts
+
+    A dataset is a directory with one `.npy` file per field, holding the
+    concatenation of that field over all episodes, plus `offsets.npy`, the
+    [N+1] episode boundaries. Columns are opened with `mmap_mode='r'`, so
+    reading a batch only touches its own pages and nothing is unpickled.
+
+    Convert a pickled list of rollouts with
+        python -m ushiriki.infrastructure.expert_data expert.pkl expert_dir
+"""
+import os
+import pickle
+
+import numpy as np
+
+from ushiriki.infrastructure.utils import convert_listofrollouts
+
+COLUMNS = ('observation', 'action', 'reward', 'next_observation', 'terminal')
+OFFSETS = 'offsets'
+
+
+def write_columnar(paths, data_dir):
+    """
+        Write a list of rollout dicts as a columnar dataset
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    observations, actions, next_observations, terminals, rewards, _ = \
+        convert_listofrollouts(paths)
+    columns = {'observation': observations, 'action': actions,
+               'reward': rewards, 'next_observation': next_observations,
+               'terminal': terminals}
+    for name in COLUMNS:
+        np.save(os.path.join(data_dir, name + '.npy'),
+                np.asarray(columns[name], dtype=np.float32))
+
+    lengths = [len(path['reward']) for path in paths]
+    np.save(os.path.join(data_dir, OFFSETS + '.npy'),
+            np.cumsum([0] + lengths, dtype=np.int64))
+
+
+def convert_pickle_to_columnar(pkl_path, data_dir):
+    """
+        Convert expert data pickled as a list of rollout dicts
+    """
+    with open(pkl_path, 'rb') as f:
+        paths = pickle.load(f)
+    write_columnar(paths, data_dir)
+    return len(paths)
+
+
+def is_columnar(path):
+    return os.path.isfile(os.path.join(path, OFFSETS + '.npy'))
+
+
+class ExpertDataReader(object):
+    """
+        Streaming reader of a columnar dataset
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.columns = {name: np.load(os.path.join(data_dir, name + '.npy'),
+                                      mmap_mode='r')
+                        for name in COLUMNS}
+        self.offsets = np.load(os.path.join(data_dir, OFFSETS + '.npy'))
+
+    def __len__(self):
+        """
+            Number of episodes
+        """
+        return len(self.offsets) - 1
+
+    @property
+    def num_steps(self):
+        return int(self.offsets[-1])
+
+    def episode_returns(self, chunk_episodes=65536):
+        """
+            Undiscounted return of every episode, summing the mapped
+            reward column `chunk_episodes` episodes at a time
+        """
+        rewards = self.columns['reward']
+        returns = np.zeros(len(self), dtype=np.float32)
+        for first in range(0, len(self), chunk_episodes):
+            last = min(first + chunk_episodes, len(self))
+            start, stop = self.offsets[first], self.offsets[last]
+            returns[first:last] = np.add.reduceat(
+                rewards[start:stop], self.offsets[first:last] - start)
+        return returns
+
+    def _path(self, start, stop):
+        path = {name: np.array(column[start:stop])
+                for name, column in self.columns.items()}
+        path['image_obs'] = np.array([], dtype=np.uint8)
+        return path
+
+    def iter_paths(self, batch_size):
+        """
+            Yield lists of whole episodes, each list covering about
+            `batch_size` steps
+        """
+        first = 0
+        while first < len(self):
+            # last episode of the batch: the one that reaches batch_size
+            last = int(np.searchsorted(self.offsets,
+                                       self.offsets[first] + batch_size))
+            last = min(max(last, first + 1), len(self))
+            yield [self._path(self.offsets[i], self.offsets[i + 1])
+                   for i in range(first, last)]
+            first = last
+
+    def iter_transitions(self, batch_size, shuffle=False, seed=None):
+        """
+            Yield (obs, acs, rews, next_obs, terminals) batches of
+            `batch_size` transitions (the last one may be smaller), in the
+            order of `ReplayBuffer.sample_random_data`
+
+            With shuffle, batches are drawn from the whole dataset without
+            replacement, otherwise they are consecutive slices.
+        """
+        order = None
+        if shuffle:
+            order = np.random.RandomState(seed).permutation(self.num_steps)
+        for start in range(0, self.num_steps, batch_size):
+            if order is None:
+                rows = slice(start, start + batch_size)
+            else:
+                # sorted rows read the mapped columns sequentially
+                rows = np.sort(order[start:start + batch_size])
+            yield tuple(np.asarray(self.columns[name][rows]) for name in COLUMNS)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Convert pickled expert rollouts to the columnar format')
+    parser.add_argument('pkl_path', type=str)
+    parser.add_argument('data_dir', type=str)
+    args = parser.parse_args()
+
+    n_paths = convert_pickle_to_columnar(args.pkl_path, args.data_dir)
+    print('Wrote {} rollouts to {}'.format(n_paths, args.data_dir))
+
+
+if __name__ == "__main__":
+    main()
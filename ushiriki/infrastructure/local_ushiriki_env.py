@@ -0,0 +1,199 @@
+"""
+    Offline, in-process stand-in for the Ushiriki challenge backend.
+
+    The hosted environment answers every `evaluateAction`/`evaluatePolicy`
+    call over HTTP. This module reproduces the same interface on top of a
+    small pure-NumPy malaria transmission model, so that training runs
+    without the network and many episodes can be stepped at once with
+    `step_batch`.
+"""
+import numpy as np
+
+from .env_data import EnvData
+
+
+class LocalUshirikiEnvironment(object):
+    """
+        Pure-NumPy simulator exposing the ChallengeEnvironment interface
+
+        State is the simulation year (1..policyDimension). Behind it, every
+        episode carries a malaria prevalence that evolves with the chosen
+        interventions, so the reward depends on the whole action history
+        while the observed state stays independent of the action.
+
+        Actions are `[ITN coverage, IRS coverage]` in [0, 1]; values outside
+        that range are clipped. The reward is the prevalence averted relative
+        to doing nothing, per unit cost of the interventions.
+
+        `n_calls` counts the evaluations the hosted API would charge for:
+        one per evaluated action, and one per whole policy.
+    """
+
+    # intervention efficacy on transmission
+    itn_efficacy = 0.55
+    irs_efficacy = 0.45
+    # prevalence dynamics
+    transmission_rate = 0.9
+    recovery_rate = 0.35
+    initial_prevalence = 0.3
+    # cost model
+    itn_cost = 1.0
+    irs_cost = 1.6
+    fixed_cost = 0.25
+    reward_scale = 100.
+
+    def __init__(self,
+                 baseuri=None,
+                 experimentCount=None,
+                 seed=None,
+                 noise=0.,
+                 policyDimension=5,
+                 **args):
+        # `baseuri` and the remaining credentials are accepted, and ignored,
+        # so the same `env_creds` work for both backends
+        self.policyDimension = policyDimension
+        self.actionDimension = 2
+        self.observation_dim = 1
+        self.env = EnvData
+        self.experimentCount = experimentCount
+        self.noise = noise
+        self.rng = np.random.RandomState(seed)
+        self.n_calls = 0
+
+        self.reset()
+        self.reset_batch(1)
+
+    ##################################
+
+    def _transition(self, prevalence, actions):
+        """
+            Advance prevalence by one year for a batch of episodes
+
+            prevalence: shape [N]
+            actions: shape [N, 2]
+
+            returns the next prevalence and the reward of each episode
+        """
+        actions = np.clip(actions, 0., 1.)
+        itn, irs = actions[:, 0], actions[:, 1]
+
+        coverage = 1. - (1. - self.itn_efficacy * itn) * \
+            (1. - self.irs_efficacy * irs)
+
+        growth = self.transmission_rate * prevalence * (1. - prevalence)
+        recovered = self.recovery_rate * prevalence
+
+        untreated = np.clip(prevalence + growth - recovered, 0., 1.)
+        treated = np.clip(prevalence + growth * (1. - coverage) - recovered,
+                          0., 1.)
+
+        cost = self.itn_cost * itn + self.irs_cost * irs + self.fixed_cost
+        rewards = self.reward_scale * (untreated - treated) / cost
+
+        if self.noise:
+            rewards = rewards * np.exp(
+                self.noise * self.rng.standard_normal(rewards.shape))
+
+        return treated, rewards
+
+    ##################################
+
+    def reset(self):
+        """
+            Reset initial state
+        """
+        self.state = 1
+        self.done = False
+        self.history = []
+        self._prevalence = np.array([self.initial_prevalence])
+        return np.array([self.state])
+
+    def evaluateAction(self, action):
+        """
+            Evaluate a single action for the current year
+        """
+        self._prevalence, reward = self._transition(
+            self._prevalence, np.asarray(action, dtype=np.float64)[None])
+        self.history.append(action)
+        self.n_calls += 1
+
+        self.state += 1
+        self.done = self.state > self.policyDimension
+        return self.state, float(reward[0]), self.done, {}
+
+    def step(self, ac):
+        """Take action step"""
+        return self.evaluateAction(ac)
+
+    def evaluatePolicy(self, data):
+        """
+            Evaluate whole policies
+
+            data: a policy `{'1': [itn, irs], ..., '5': [itn, irs]}`,
+                or a list of them
+
+            returns the total reward of the policy (a list for a list input)
+        """
+        if isinstance(data, dict):
+            return float(self.evaluatePolicySteps([data]).sum())
+        return [float(r) for r in self.evaluatePolicySteps(data).sum(axis=1)]
+
+    def evaluatePolicySteps(self, policies):
+        """
+            Per-year rewards of a list of policy dicts, shape [N, T]
+        """
+        actions = np.array([
+            [policy[str(year)] for year in range(1, self.policyDimension + 1)]
+            for policy in policies], dtype=np.float64)
+        return self.evaluate_actions_batch(actions)
+
+    def evaluate_actions_batch(self, actions):
+        """
+            Roll out N whole episodes at once
+
+            actions: shape [N, T, 2], the action of every episode at every year
+
+            returns the per-year rewards, shape [N, T]
+        """
+        n_episodes, n_years = actions.shape[:2]
+        self.n_calls += n_episodes
+        prevalence = np.full(n_episodes, self.initial_prevalence)
+        rewards = np.empty((n_episodes, n_years))
+
+        for year in range(n_years):
+            prevalence, rewards[:, year] = self._transition(
+                prevalence, actions[:, year])
+
+        return rewards
+
+    ##################################
+
+    def reset_batch(self, n):
+        """
+            Reset N independent episodes for `step_batch`
+
+            returns the initial observations, shape [N, 1]
+        """
+        self.batch_state = np.ones(n, dtype=np.int64)
+        self._batch_prevalence = np.full(n, self.initial_prevalence)
+        return self.batch_state[:, None].astype(np.float32)
+
+    def step_batch(self, actions):
+        """
+            Step every episode of the batch by one year
+
+            actions: shape [N, 2]
+
+            returns next observations [N, 1], rewards [N], dones [N], info
+        """
+        actions = np.asarray(actions, dtype=np.float64)
+        assert actions.shape == (self.batch_state.size, self.actionDimension), \
+            'step_batch expects actions of shape [N, 2], N set by reset_batch'
+
+        self._batch_prevalence, rewards = self._transition(
+            self._batch_prevalence, actions)
+        self.n_calls += len(actions)
+        self.batch_state = self.batch_state + 1
+        dones = self.batch_state > self.policyDimension
+
+        return self.batch_state[:, None].astype(np.float32), rewards, dones, {}
@@ -1,30 +1,132 @@
 import os
+import queue
+import threading
+import time
 from tensorboardX import SummaryWriter
 import numpy as np
 
+# queued by close to stop the writer thread
+_STOP = object()
+
 class Logger:
-    def __init__(self, log_dir, n_logged_samples=10, summary_writer=None):
+    """
+        Tensorboard logger
+
+        By default every call writes through to the event file. With
+        async_mode, calls are queued and a background thread writes them
+        in batches, flushing the event file every `flush_secs`. When
+        `queue_size` calls are pending, logging blocks until the writer
+        catches up. `flush` waits for the queue to drain, `close` also
+        stops the writer. A failed write stops the writing; the error is
+        raised by the next logging call, `flush` or `close`.
+    """
+    def __init__(self, log_dir, n_logged_samples=10, summary_writer=None,
+                 async_mode=False, flush_secs=10, queue_size=1000):
         self._log_dir = log_dir
         print('########################')
         print('logging outputs to ', log_dir)
         print('########################')
         self._n_logged_samples = n_logged_samples
-        self._summ_writer = SummaryWriter(log_dir, flush_secs=1, max_queue=1)
+
+        self._async = async_mode
+        if not async_mode:
+            self._summ_writer = SummaryWriter(log_dir, flush_secs=1, max_queue=1)
+            return
+
+        # the writer thread does its own batching and flushing
+        self._summ_writer = SummaryWriter(log_dir, flush_secs=flush_secs,
+                                          max_queue=queue_size)
+        self._flush_secs = flush_secs
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer_error = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    ##################################
+
+    def _submit(self, method, *args, **kwargs):
+        if not self._async:
+            getattr(self._summ_writer, method)(*args, **kwargs)
+            return
+        self._check_writer()
+        # a full queue only drains while the writer is alive
+        while True:
+            try:
+                self._queue.put((method, args, kwargs), timeout=.1)
+                return
+            except queue.Full:
+                self._check_writer()
+
+    def _write_loop(self):
+        last_flush = time.time()
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_secs)
+            except queue.Empty:
+                item = None
+
+            # drain what is already queued before flushing
+            batch = [] if item is None else [item]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            for entry in batch:
+                if entry is _STOP:
+                    stop = True
+                elif self._writer_error is None:
+                    method, args, kwargs = entry
+                    try:
+                        getattr(self._summ_writer, method)(*args, **kwargs)
+                    except Exception as e:
+                        self._writer_error = e
+
+            if stop or time.time() - last_flush >= self._flush_secs:
+                try:
+                    self._summ_writer.flush()
+                except Exception as e:
+                    if self._writer_error is None:
+                        self._writer_error = e
+                last_flush = time.time()
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _raise_writer_error(self):
+        if self._writer_error is not None:
+            error, self._writer_error = self._writer_error, None
+            raise error
+
+    def _check_writer(self):
+        self._raise_writer_error()
+        if not self._writer.is_alive():
+            raise RuntimeError('The logger writer thread has stopped')
+
+    ##################################
 
     def log_scalar(self, scalar, name, step_):
-        self._summ_writer.add_scalar('{}'.format(name), scalar, step_)
+        self._submit('add_scalar', '{}'.format(name), float(scalar), step_)
 
     def log_scalars(self, scalar_dict, group_name, step, phase):
         """Will log all scalars in the same plot."""
-        self._summ_writer.add_scalars('{}_{}'.format(group_name, phase), scalar_dict, step)
+        self._submit('add_scalars', '{}_{}'.format(group_name, phase),
+                     {key: float(value) for key, value in scalar_dict.items()}, step)
+
+    def log_histogram(self, values, name, step):
+        # copied, the caller may reuse its array before the write
+        self._submit('add_histogram', '{}'.format(name), np.array(values), step)
 
     def log_image(self, image, name, step):
         assert(len(image.shape) == 3)  # [C, H, W]
-        self._summ_writer.add_image('{}'.format(name), image, step)
+        self._submit('add_image', '{}'.format(name), np.array(image), step)
 
     def log_video(self, video_frames, name, step, fps=10):
         assert len(video_frames.shape) == 5, "Need [N, T, C, H, W] input tensor for video logging!"
-        self._summ_writer.add_video('{}'.format(name), video_frames, step, fps=fps)
+        self._submit('add_video', '{}'.format(name), np.array(video_frames), step, fps=fps)
 
     def log_paths_as_videos(self, paths, step, max_videos_to_save=2, fps=10, video_title='video'):
 
@@ -51,24 +153,43 @@ class Logger:
     def log_figures(self, figure, name, step, phase):
         """figure: matplotlib.pyplot figure handle"""
         assert figure.shape[0] > 0, "Figure logging requires input shape [batch x figures]!"
-        self._summ_writer.add_figure('{}_{}'.format(name, phase), figure, step)
+        self._submit('add_figure', '{}_{}'.format(name, phase), figure, step)
 
     def log_figure(self, figure, name, step, phase):
         """figure: matplotlib.pyplot figure handle"""
-        self._summ_writer.add_figure('{}_{}'.format(name, phase), figure, step)
+        self._submit('add_figure', '{}_{}'.format(name, phase), figure, step)
 
     def log_graph(self, array, name, step, phase):
         """figure: matplotlib.pyplot figure handle"""
         im = plot_graph(array)
-        self._summ_writer.add_image('{}_{}'.format(name, phase), im, step)
+        self._submit('add_image', '{}_{}'.format(name, phase), im, step)
 
     def dump_scalars(self, log_path=None):
         log_path = os.path.join(self._log_dir, "scalar_data.json") if log_path is None else log_path
+        self.flush()
         self._summ_writer.export_scalars_to_json(log_path)
 
     def flush(self):
+        if self._async:
+            # everything queued so far is written, then flushed; unlike
+            # Queue.join, this does not wait on a writer that has stopped
+            done = self._queue.all_tasks_done
+            with done:
+                while self._queue.unfinished_tasks and self._writer.is_alive():
+                    done.wait(timeout=.1)
+            self._check_writer()
         self._summ_writer.flush()
 
+    def close(self):
+        try:
+            if self._async:
+                if self._writer.is_alive():
+                    self._queue.put(_STOP)
+                    self._writer.join()
+                self._raise_writer_error()
+        finally:
+            self._summ_writer.close()
+
 
 
 
@@ -0,0 +1,100 @@
+"""
+    Wall-clock timing of the phases of a training iteration
+
+    Code on the hot path wraps its phases in `timer.phase(name)` and
+    counts events with `timer.count(name)`, using the module-level `timer`.
+    Timing is off by default. Then `phase` hands back one shared no-op
+    context manager, so instrumented code only pays a method call.
+    Phases are also recorded as spans when the tracer is on.
+"""
+import contextlib
+import functools
+import threading
+import time
+from collections import defaultdict
+
+from ushiriki.infrastructure.tracer import tracer
+
+
+class _Phase(object):
+    __slots__ = ('timer', 'name', 'start', 'span')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.span = tracer.span(self.name)
+        self.span.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timer.enabled:
+            self.timer.add(self.name, time.perf_counter() - self.start)
+        self.span.__exit__(*exc_info)
+        return False
+
+
+class PhaseTimer(object):
+    """
+        Total time and number of calls per phase, plus event counters,
+        accumulated until `reset`
+
+        Phases may nest and may run on several threads at once; a phase's
+        time is the sum over its calls.
+    """
+
+    _disabled = contextlib.nullcontext()
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def phase(self, name):
+        if not (self.enabled or tracer.enabled):
+            return self._disabled
+        return _Phase(self, name)
+
+    def timed(self, name):
+        """
+            Decorator running every call of a function as a phase
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.seconds[name] += seconds
+            self.calls[name] += 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def summary(self):
+        """
+            {phase: {'seconds': total, 'calls': n}} and {counter: n}
+        """
+        with self._lock:
+            phases = {name: {'seconds': self.seconds[name],
+                             'calls': self.calls[name]}
+                      for name in sorted(self.seconds)}
+            return {'phases': phases, 'counters': dict(self.counters)}
+
+    def reset(self):
+        with self._lock:
+            self.seconds = defaultdict(float)
+            self.calls = defaultdict(int)
+            self.counters = defaultdict(int)
+
+
+# shared by all instrumented code
+timer = PhaseTimer()
@@ -1,79 +1,194 @@
+from collections import deque
+
 import numpy as np
 
 from ushiriki.infrastructure.utils import *
+from ushiriki.infrastructure import profiler
 
 class ReplayBuffer(object):
+    """
+        Ring buffer of the most recent `max_size` transitions
+
+        Each field is a float32 array allocated on the first add, once the
+        field shapes are known, and new transitions overwrite the oldest
+        ones. An index of (start, length) per episode, in absolute step
+        counts, tracks the episodes still fully stored.
+
+        Every transition is written twice, at row i and at row i + max_size,
+        so any run of up to max_size consecutive steps is a contiguous
+        slice. Recent data is therefore returned as views of the storage,
+        which stay valid until the next add_rollouts.
+
+        With a RolloutStore, every added rollout is also persisted, and
+        `load_from_store` refills the buffer from a previous run.
+    """
 
-    def __init__(self, max_size=1000000):
+    def __init__(self, max_size=1000000, store=None):
 
         self.max_size = max_size
-        self.paths = []
+        self.store = store
         self.obs = None
         self.acs = None
         self.concatenated_rews = None
-        self.unconcatenated_rews = None
         self.next_obs = None
         self.terminals = None
 
+        # number of stored transitions, and of transitions ever added
+        self._size = 0
+        self._total = 0
+        self._episodes = deque()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def total_added(self):
+        """
+            Number of transitions ever added, evicted ones included
+        """
+        return self._total
+
+    def _allocate(self, fields):
+        return [np.empty((2 * self.max_size,) + field.shape[1:], dtype=np.float32)
+                for field in fields]
+
+    def _buffers(self):
+        return [self.obs, self.acs, self.next_obs, self.terminals,
+                self.concatenated_rews]
+
+    def _window(self, start, length):
+        """
+            Contiguous buffer rows of the `length` steps from absolute step `start`
+        """
+        pos = start % self.max_size
+        return slice(pos, pos + length)
+
     def add_rollouts(self, paths):
 
-        # add new rollouts into our list of rollouts
+        # an episode that cannot be stored whole could not be indexed
         for path in paths:
-            self.paths.append(path)
-
-        # convert new rollouts into their component arrays, and append them onto our arrays
+            if get_pathlength(path) > self.max_size:
+                raise ValueError('Episode of {} steps does not fit in a buffer '
+                                 'of {} steps'.format(get_pathlength(path),
+                                                      self.max_size))
+        if self.store is not None:
+            with profiler.timer.phase('buffer/store_append'):
+                self.store.append(paths)
+        with profiler.timer.phase('buffer/add'):
+            self._insert(paths)
+
+    def load_from_store(self, max_steps=None, batch_steps=100000):
+        """
+            Fill the buffer with the most recent episodes of the store,
+            at most `max_steps` steps (and `max_size`), reading
+            `batch_steps` steps at a time
+
+            returns the number of steps loaded
+        """
+        max_steps = self.max_size if max_steps is None else min(max_steps, self.max_size)
+        start = self.store.recent_episodes(max_steps)
+        n_steps = 0
+        for paths in self.store.iter_batches(batch_steps, start=start):
+            self._insert(paths)
+            n_steps += sum(get_pathlength(path) for path in paths)
+        return n_steps
+
+    def _insert(self, paths):
+
+        # convert new rollouts into their component arrays
         observations, actions, next_observations, terminals, concatenated_rews, unconcatenated_rews = convert_listofrollouts(paths)
+        fields = [observations, actions, next_observations, terminals, concatenated_rews]
 
         if self.obs is None:
-            self.obs = observations[-self.max_size:]
-            self.acs = actions[-self.max_size:]
-            self.next_obs = next_observations[-self.max_size:]
-            self.terminals = terminals[-self.max_size:]
-            self.concatenated_rews = concatenated_rews[-self.max_size:]
-            self.unconcatenated_rews = unconcatenated_rews[-self.max_size:]
-        else:
-            self.obs = np.concatenate([self.obs, observations])[-self.max_size:]
-            self.acs = np.concatenate([self.acs, actions])[-self.max_size:]
-            self.next_obs = np.concatenate([self.next_obs, next_observations])[-self.max_size:]
-            self.terminals = np.concatenate([self.terminals, terminals])[-self.max_size:]
-            self.concatenated_rews = np.concatenate([self.concatenated_rews, concatenated_rews])[-self.max_size:]
-            if isinstance(unconcatenated_rews, list):
-                self.unconcatenated_rews += unconcatenated_rews
-            else:
-                self.unconcatenated_rews.append(unconcatenated_rews)
+            self.obs, self.acs, self.next_obs, self.terminals, self.concatenated_rews = self._allocate(fields)
+
+        # index the new episodes from their absolute first step
+        start = self._total
+        for rews in unconcatenated_rews:
+            self._episodes.append((start, len(rews)))
+            start += len(rews)
+
+        # write only what fits, along with its mirror copy
+        n = len(concatenated_rews)
+        keep = min(n, self.max_size)
+        pos = (self._total + n - keep) % self.max_size
+        first = min(keep, self.max_size - pos)
+        for buffer, field in zip(self._buffers(), fields):
+            field = field[n - keep:]
+            buffer[pos:pos + keep] = field
+            buffer[pos + self.max_size:pos + first + self.max_size] = field[:first]
+            buffer[:keep - first] = field[first:]
+
+        self._total += n
+        self._size = min(self._size + n, self.max_size)
+
+        # drop the episodes that were (partly) overwritten
+        oldest = self._total - self._size
+        while self._episodes and self._episodes[0][0] < oldest:
+            self._episodes.popleft()
 
     ########################################
     ########################################
 
+    def _episode_path(self, start, length):
+        rows = self._window(start, length)
+        return Path(self.obs[rows], [], self.acs[rows],
+                    self.concatenated_rews[rows], self.next_obs[rows],
+                    self.terminals[rows])
+
     def sample_random_rollouts(self, num_rollouts):
-        rand_indices = np.random.permutation(len(self.paths))[:num_rollouts]
-        return self.paths[rand_indices]
+        rand_indices = np.random.permutation(len(self._episodes))[:num_rollouts]
+        return [self._episode_path(*self._episodes[i]) for i in rand_indices]
 
     def sample_recent_rollouts(self, num_rollouts=1):
-        return self.paths[-num_rollouts:]
+        recent = list(self._episodes)[-num_rollouts:]
+        return [self._episode_path(start, length) for start, length in recent]
 
     ########################################
     ########################################
 
     def sample_random_data(self, batch_size):
-
-        assert self.obs.shape[0] == self.acs.shape[0] == self.concatenated_rews.shape[0] == self.next_obs.shape[0] == self.terminals.shape[0]
-        rand_indices = np.random.permutation(self.obs.shape[0])[:batch_size]
+        with profiler.timer.phase('buffer/sample'):
+            return self._sample_random_data(batch_size)
+
+    def _sample_random_data(self, batch_size):
+
+        # partial Fisher-Yates over the buffer rows: O(batch_size) and
+        # without replacement, only the swapped rows are remembered
+        n = min(batch_size, self._size)
+        picks = np.random.randint(np.arange(n), self._size)
+        swapped = {}
+        rand_indices = np.empty(n, dtype=np.int64)
+        for i, j in enumerate(picks):
+            rand_indices[i] = swapped.get(j, j)
+            swapped[j] = swapped.get(i, i)
         return self.obs[rand_indices], self.acs[rand_indices], self.concatenated_rews[rand_indices], self.next_obs[rand_indices], self.terminals[rand_indices]
 
     def sample_recent_data(self, batch_size=1, concat_rew=True):
+        with profiler.timer.phase('buffer/sample'):
+            return self._sample_recent_data(batch_size, concat_rew)
+
+    def _sample_recent_data(self, batch_size, concat_rew):
 
         if concat_rew:
-            return self.obs[-batch_size:], self.acs[-batch_size:], self.concatenated_rews[-batch_size:], self.next_obs[-batch_size:], self.terminals[-batch_size:]
+            batch_size = min(batch_size, self._size)
+            rows = self._window(self._total - batch_size, batch_size)
+            return self.obs[rows], self.acs[rows], self.concatenated_rews[rows], self.next_obs[rows], self.terminals[rows]
         else:
-            num_recent_rollouts_to_return = 0
+            # walk the episode index back until we have enough steps
+            lengths = []
             num_datapoints_so_far = 0
-            index = -1
-            while num_datapoints_so_far < batch_size:
-                recent_rollout = self.paths[index]
-                index -=1
-                num_recent_rollouts_to_return +=1
-                num_datapoints_so_far += get_pathlength(recent_rollout)
-            rollouts_to_return = self.paths[-num_recent_rollouts_to_return:]
-            observations, actions, next_observations, terminals, concatenated_rews, unconcatenated_rews = convert_listofrollouts(rollouts_to_return)
-            return observations, actions, unconcatenated_rews, next_observations, terminals
+            for start, length in reversed(self._episodes):
+                if num_datapoints_so_far >= batch_size:
+                    break
+                lengths.append(length)
+                num_datapoints_so_far += length
+            lengths.reverse()
+
+            # the most recent episodes are contiguous in absolute steps,
+            # so they come back as views, with one reward view per episode
+            rows = self._window(self._total - num_datapoints_so_far, num_datapoints_so_far)
+
+            rews = self.concatenated_rews[rows]
+            unconcatenated_rews = np.split(rews, np.cumsum(lengths)[:-1])
+            return self.obs[rows], self.acs[rows], unconcatenated_rews, self.next_obs[rows], self.terminals[rows]
@@ -0,0 +1,108 @@
+"""
+    Vectorized return estimation over batches of rollouts
+
+    Rollouts are laid out as a padded [N, T] float32 reward matrix with a
+    boolean mask of the valid steps, so returns are computed for all
+    rollouts at once with reverse scans over the T columns.
+"""
+import numpy as np
+
+
+def pad_rewards(rews_list, dtype=np.float32):
+    """
+        Stack a list of per-rollout reward arrays
+
+        returns:
+            rewards: shape [N, T], zero past the end of each rollout
+            mask: shape [N, T], True on the valid steps
+    """
+    lengths = np.array([len(r) for r in rews_list])
+    return pad_segments(np.concatenate(rews_list).astype(dtype, copy=False),
+                        lengths)
+
+
+def pad_segments(values, lengths):
+    """
+        Lay out consecutive segments of a flat array as rows of a
+        zero-padded [N, T] matrix
+
+        returns the padded values and the mask of the valid steps
+    """
+    mask = np.arange(lengths.max()) < lengths[:, None]
+
+    padded = np.zeros(mask.shape, dtype=values.dtype)
+    padded[mask] = values
+    return padded, mask
+
+
+def episode_lengths(terminals):
+    """
+        Lengths of the episodes of a concatenated batch, each one ending
+        on a terminal step. Trailing steps after the last terminal form a
+        final, truncated episode.
+    """
+    ends = np.flatnonzero(terminals) + 1
+    if ends.size == 0 or ends[-1] != len(terminals):
+        ends = np.append(ends, len(terminals))
+    return np.diff(ends, prepend=0)
+
+
+def unpad(values, mask):
+    """
+        Flatten [N, T] values back to the concatenation of the rollouts
+    """
+    return values[mask]
+
+
+def discounted_returns(rewards, mask, gamma):
+    """
+        Full-trajectory returns: every step t of rollout n gets
+        sum_{t'=0}^{T_n-1} gamma^t' r_{n,t'}
+    """
+    discounts = np.power(np.asarray(gamma, dtype=rewards.dtype),
+                         np.arange(rewards.shape[1], dtype=rewards.dtype))
+    returns = rewards @ discounts
+    return np.where(mask, returns[:, None], rewards.dtype.type(0))
+
+
+def reward_to_go(rewards, mask, gamma):
+    """
+        Discounted reward-to-go: every step t of rollout n gets
+        sum_{t'=t}^{T_n-1} gamma^(t'-t) r_{n,t'}
+
+        Computed with a reverse scan over the columns. Padded steps hold
+        zero rewards, so they contribute nothing and stay zero.
+    """
+    gamma = rewards.dtype.type(gamma)
+    rtg = np.zeros_like(rewards)
+    running = np.zeros(rewards.shape[0], dtype=rewards.dtype)
+    for t in reversed(range(rewards.shape[1])):
+        running = rewards[:, t] + gamma * running
+        rtg[:, t] = running
+    return rtg
+
+
+def gae(rewards, values, terminals, gamma, lamda):
+    """
+        Generalized advantage estimates of a concatenated batch of episodes
+
+        delta[t] = r[t] + gamma * V[t+1] * (1 - terminal[t]) - V[t]
+        adv[t] = sum_{l>=0} (gamma * lamda)^l * delta[t+l], within the episode
+
+        The value after the last step of the batch is taken as zero.
+
+        returns the advantages, with the dtype of rewards/values
+    """
+    values = np.atleast_1d(values)
+    dtype = np.result_type(rewards, values)
+    rewards = rewards.astype(dtype, copy=False)
+    values = values.astype(dtype, copy=False)
+    not_terminal = 1 - np.asarray(terminals, dtype=dtype)
+
+    next_values = np.append(values[1:], dtype.type(0))
+    deltas = rewards + dtype.type(gamma) * next_values * not_terminal - values
+
+    # the advantage is the discounted reward-to-go of the deltas,
+    # with gamma * lamda as discount
+    deltas, mask = pad_segments(deltas, episode_lengths(terminals))
+    return unpad(reward_to_go(deltas, mask, gamma * lamda), mask)
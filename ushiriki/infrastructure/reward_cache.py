@@ -0,0 +1,264 @@
+"""
+    Persistent reward cache in front of the Ushiriki environment API
+
+    Rewards are stored in an sqlite file keyed on quantized actions, so
+    repeated queries of (nearly) the same action or policy are answered
+    locally, across runs, without spending network round trips or
+    `experimentCount` budget.
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RewardCache(object):
+    """
+        On-disk LRU store of rewards
+
+        Keys are built from actions quantized to a grid of step `quantum`,
+        so actions closer than the grid step share an entry. Once more than
+        `max_entries` rewards are stored, the least recently used ones are
+        evicted.
+    """
+
+    def __init__(self, path, quantum=1e-2, max_entries=1000000):
+        self.path = path
+        self.quantum = quantum
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        # the trainer may query the env from several threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS rewards '
+            '(key TEXT PRIMARY KEY, reward REAL, last_used INTEGER)')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS rewards_lru ON rewards (last_used)')
+        self._db.commit()
+
+        self._size, clock = self._db.execute(
+            'SELECT COUNT(*), MAX(last_used) FROM rewards').fetchone()
+        self._clock = clock or 0
+
+        # recency of the hits, written with the next put: an uncommitted
+        # UPDATE would hold the write lock other processes need
+        self._touched = {}
+
+    ##################################
+
+    def quantize(self, action):
+        return tuple(int(q) for q in np.round(
+            np.asarray(action, dtype=np.float64) / self.quantum))
+
+    def action_key(self, history, action):
+        """
+            Key of an action taken after the actions of `history`, earlier
+            years first, which the reward also depends on
+        """
+        return 'a:' + ';'.join(
+            str(self.quantize(ac)) for ac in list(history) + [action])
+
+    def policy_key(self, policy):
+        """
+            Key of a whole policy `{'1': action, ..., '5': action}`
+        """
+        years = sorted(policy, key=int)
+        return 'p:' + ';'.join(
+            '{}={}'.format(year, self.quantize(policy[year])) for year in years)
+
+    ##################################
+
+    def get(self, key):
+        """
+            Return the cached reward of `key`, or None on a miss
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT reward FROM rewards WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._clock += 1
+            self._touched[key] = self._clock
+            return row[0]
+
+    def get_many(self, keys):
+        """
+            Return the cached rewards of all the `keys`, or None if any is
+            missing, counting each key as a hit, or as a miss
+        """
+        with self._lock:
+            rewards = []
+            for key in keys:
+                row = self._db.execute(
+                    'SELECT reward FROM rewards WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    self.misses += len(keys)
+                    return None
+                rewards.append(row[0])
+
+            self.hits += len(keys)
+            for key in keys:
+                self._clock += 1
+                self._touched[key] = self._clock
+            return rewards
+
+    def _write_touched(self):
+        self._db.executemany('UPDATE rewards SET last_used = ? WHERE key = ?',
+                             [(clock, key) for key, clock in self._touched.items()])
+        self._touched = {}
+
+    def put(self, key, reward):
+        self.put_many([(key, reward)])
+
+    def put_many(self, items):
+        """
+            Store the (key, reward) pairs of `items`, in one transaction
+        """
+        with self._lock:
+            self._write_touched()
+            for key, reward in items:
+                self._clock += 1
+                inserted = self._db.execute(
+                    'INSERT OR IGNORE INTO rewards (key, reward, last_used) '
+                    'VALUES (?, ?, ?)', (key, float(reward), self._clock)).rowcount
+                if inserted:
+                    self._size += 1
+                else:
+                    self._db.execute(
+                        'UPDATE rewards SET reward = ?, last_used = ? WHERE key = ?',
+                        (float(reward), self._clock, key))
+
+            # drop the least recently used entries beyond the size bound
+            if self._size > self.max_entries:
+                self._db.execute(
+                    'DELETE FROM rewards WHERE key IN '
+                    '(SELECT key FROM rewards ORDER BY last_used LIMIT ?)',
+                    (self._size - self.max_entries,))
+                self._size = self.max_entries
+            self._db.commit()
+
+    ##################################
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': self._size,
+                'hit_rate': self.hits / lookups if lookups else 0.}
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._db.commit()
+            self._db.close()
+
+
+class CachedUshirikiEnvironment(object):
+    """
+        Serves `evaluateAction`/`evaluatePolicy`/`evaluatePolicySteps` from
+        a RewardCache, forwarding only the misses to the wrapped environment
+
+        Action rewards are keyed on the actions of the episode so far, since
+        the reward of a year depends on the actions of earlier years. After
+        cache hits, the wrapped env has not seen the episode's latest
+        actions, so on the next miss they are replayed to it first: only
+        episodes that hit all the way through save calls. The per-year
+        rewards of whole policies share these keys, so either kind of
+        query serves the other.
+        Every other attribute is looked up on the wrapped environment.
+    """
+
+    def __init__(self, base_env, cache):
+        self.base_env = base_env
+        self.cache = cache
+        self._actions = []
+        self._synced = 0
+
+    def __getattr__(self, name):
+        return getattr(self.base_env, name)
+
+    def reset(self):
+        # actions of the episode, and how many of them the env has seen
+        self._actions = []
+        self._synced = 0
+        return self.base_env.reset()
+
+    def evaluateAction(self, action):
+        key = self.cache.action_key(self._actions, action)
+        reward = self.cache.get(key)
+        year = len(self._actions) + 1
+
+        if reward is None:
+            # bring the env to the same point of the episode
+            for earlier in self._actions[self._synced:]:
+                self.base_env.evaluateAction(earlier)
+            ob, reward, done, info = self.base_env.evaluateAction(action)
+            self._synced = year
+            self.cache.put(key, reward)
+        else:
+            ob, info = year + 1, {}
+            done = ob > self.base_env.policyDimension
+
+        self._actions.append(action)
+        return ob, reward, done, info
+
+    def step(self, ac):
+        """Take action step"""
+        return self.evaluateAction(ac)
+
+    def evaluatePolicy(self, data):
+        if isinstance(data, dict):
+            return self.evaluatePolicy([data])[0]
+
+        keys = [self.cache.policy_key(policy) for policy in data]
+        rewards = [self.cache.get(key) for key in keys]
+
+        # evaluate each distinct missing policy once, in a single call
+        missing = OrderedDict()
+        for i, (key, reward) in enumerate(zip(keys, rewards)):
+            if reward is None:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            evaluated = self.base_env.evaluatePolicy(
+                [data[indices[0]] for indices in missing.values()])
+            for (key, indices), reward in zip(missing.items(), evaluated):
+                self.cache.put(key, reward)
+                for i in indices:
+                    rewards[i] = reward
+
+        return rewards
+
+    def _policy_step_keys(self, policy):
+        actions = [policy[year] for year in sorted(policy, key=int)]
+        return [self.cache.action_key(actions[:t], ac)
+                for t, ac in enumerate(actions)]
+
+    def evaluatePolicySteps(self, policies):
+        keys = [self._policy_step_keys(policy) for policy in policies]
+        rewards = [self.cache.get_many(policy_keys) for policy_keys in keys]
+
+        # evaluate each distinct policy with any year missing, in one call
+        missing = OrderedDict()
+        for i, (policy_keys, policy_rewards) in enumerate(zip(keys, rewards)):
+            if policy_rewards is None:
+                missing.setdefault(policy_keys[-1], []).append(i)
+
+        if missing:
+            evaluated = self.base_env.evaluatePolicySteps(
+                [policies[indices[0]] for indices in missing.values()])
+            for indices, policy_rewards in zip(missing.values(), evaluated):
+                policy_rewards = [float(r) for r in policy_rewards]
+                self.cache.put_many(zip(keys[indices[0]], policy_rewards))
+                for i in indices:
+                    rewards[i] = policy_rewards
+
+        return rewards
@@ -2,7 +2,8 @@ import multiprocessing
 import concurrent.futures
 import time
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
+import json
 import pickle
 import numpy as np
 import tensorflow as tf
@@ -10,10 +11,19 @@ import gym
 import os
 
 from ushiriki.infrastructure.utils import *
-from ushiriki.infrastructure.tf_utils import create_tf_session
+from ushiriki.infrastructure.tf_utils import create_tf_session, finalize_graph, GraphSizeGuard
 from ushiriki.infrastructure.logger import Logger
+from ushiriki.infrastructure.profiler import timer
+from ushiriki.infrastructure.tracer import tracer
 
-from .custom_ushiriki_env import CustomUshirikiEnvironment
+from .env_utils import EvaluationBudget, has_policy_steps, make_env
+from .reward_cache import RewardCache
+from .vec_env import VectorEnv
+from .async_collector import AsyncRolloutCollector
+from .rollout_workers import RolloutWorkerPool
+from .rollout_store import RolloutStore
+from .expert_data import ExpertDataReader, is_columnar
+from ushiriki.policies.numpy_policy import NumpyMLPPolicy
 
 
 # how many rollouts to save as videos to tensorboard
@@ -31,10 +41,23 @@ class RL_Trainer(object):
 
         # Get params, create logger, create TF session
         self.params = params
-        self.logger = Logger(self.params['logdir'])
-        env_creds = self.params['env_creds']
+
+        # Record a timeline of the run, saved at the end of training
+        tracer.enabled = bool(self.params.get('trace'))
+        if tracer.enabled:
+            tracer.set_process_name('learner')
+
+        self.logger = Logger(
+            self.params['logdir'],
+            async_mode=self.params.get('async_logging', False),
+            flush_secs=self.params.get('log_flush_secs', 10),
+            queue_size=self.params.get('log_queue_size', 1000))
         self.sess = create_tf_session(
-            self.params['use_gpu'], which_gpu=self.params['which_gpu'])
+            self.params['use_gpu'], which_gpu=self.params['which_gpu'],
+            traced=tracer.enabled)
+
+        # Time the phases of every iteration
+        timer.enabled = self.params.get('profile', False)
 
         # Set random seeds
         seed = self.params['seed']
@@ -48,7 +71,65 @@ class RL_Trainer(object):
         # Make the gym environment
         # self.env = gym.make(self.params['env_name'])
         # self.env.seed(seed)
-        self.env = CustomUshirikiEnvironment(**env_creds)
+        self.reward_cache = None
+        if self.params.get('reward_cache'):
+            # Serve repeated (quantized) actions and policies from disk
+            self.reward_cache = RewardCache(
+                self.params['reward_cache'],
+                quantum=self.params['cache_quantum'],
+                max_entries=self.params['cache_size'])
+        # every request of every env of the run spends from one budget
+        self.evaluation_budget = EvaluationBudget(
+            self.params.get('experiment_count'))
+        self.env = self._make_env()
+
+        # Open-loop collection is a collector of its own, it would silently
+        # replace the other ones
+        if self.params.get('open_loop'):
+            conflicts = [flag for flag, used in (
+                ('--n_envs', self.params.get('n_envs', 1) > 1),
+                ('--n_workers', self.params.get('n_workers', 0) > 0),
+                ('--async_collect', self.params.get('async_collect')),
+                ('--stream_collect', self.params.get('stream_collect')))
+                if used]
+            assert not conflicts, \
+                '--open_loop cannot be combined with {}'.format(', '.join(conflicts))
+
+        # Pipelined rollouts are collected from a snapshot of the weights:
+        # worker processes act from the weights broadcast after each update
+        # instead, and the other collection modes would be skipped
+        if self.params.get('pipeline'):
+            conflicts = [flag for flag, used in (
+                ('--n_workers', self.params.get('n_workers', 0) > 0),
+                ('--stream_collect', self.params.get('stream_collect')),
+                ('--parallel', self.params.get('parallel')))
+                if used]
+            assert not conflicts, \
+                '--pipeline cannot be combined with {}'.format(', '.join(conflicts))
+
+        # Without per-year rewards, the return of an open-loop episode is
+        # only right as the target of every step in undiscounted
+        # trajectory-return PG
+        if self.params.get('open_loop') and not has_policy_steps(self.env):
+            agent_params = self.params['agent_params']
+            assert agent_params['gamma'] == 1 and not (
+                agent_params['reward_to_go'] or agent_params.get('gae')), \
+                'Open-loop collection on this backend only gets whole-episode ' \
+                'returns: use discount 1, without reward-to-go or GAE'
+
+        # Step several envs in lockstep, batching the policy forward pass
+        self.vec_env = None
+        if self.params.get('n_envs', 1) > 1:
+            self.vec_env = VectorEnv(
+                [self._make_env(i) for i in range(self.params['n_envs'])])
+
+        # Run episodes concurrently, each on an env of its own
+        self.async_collector = None
+        if self.params.get('async_collect'):
+            self.async_collector = AsyncRolloutCollector(
+                self._make_env,
+                max_concurrency=self.params['max_concurrency'],
+                policy_dimension=self.env.policyDimension)
 
         # Maximum length for episodes
         self.params['ep_len'] = self.params['ep_len'] or \
@@ -78,19 +159,78 @@ class RL_Trainer(object):
         # AGENT
         #############
 
+        # Persist the collected rollouts, to warm start later runs
+        self.rollout_store = None
+        if self.params.get('rollout_store'):
+            self.rollout_store = RolloutStore(
+                self.params['rollout_store'],
+                segment_steps=self.params.get('store_segment_steps', 1000000),
+                sync_every=self.params.get('store_sync_every', 1))
+        self.params['agent_params']['rollout_store'] = self.rollout_store
+        self.params['agent_params']['seed'] = seed
+
         agent_class = self.params['agent_class']
         self.agent = agent_class(
             self.sess, self.env, self.params['agent_params'])
 
+        if self.rollout_store is not None and self.params.get('warm_start_steps'):
+            n_steps = self.agent.replay_buffer.load_from_store(
+                self.params['warm_start_steps'])
+            print('Warm started the replay buffer with {} stored steps'.format(n_steps))
+
         #############
         # INIT VARS
         #############
 
         tf.global_variables_initializer().run(session=self.sess)
 
+        # Act from a NumPy copy of the actor, without TF session dispatch
+        self.inference_policy = None
+        if self.params.get('numpy_inference'):
+            self.inference_policy = NumpyMLPPolicy.from_policy(
+                self.agent.actor, seed=seed)
+
+        # No op may be added from here on, training only runs existing ones
+        if self.params.get('finalize_graph', True):
+            self.graph_guard = finalize_graph(self.sess)
+        else:
+            self.graph_guard = GraphSizeGuard(self.sess.graph)
+
+        # Collect in worker processes, each with its own env and policy copy
+        self.rollout_workers = None
+        if self.params.get('n_workers'):
+            env_params = {key: self.params.get(key) for key in (
+                'env_backend', 'env_creds', 'reward_cache',
+                'cache_quantum', 'cache_size', 'trace')}
+            env_params['env_backend'] = env_params['env_backend'] or 'remote'
+            self.rollout_workers = RolloutWorkerPool(
+                self.params['n_workers'], env_params,
+                self.agent.actor.get_weights(), seed=seed)
+
+        # Collect the next iteration's rollouts while training on these,
+        # in a thread with its own env
+        self.pipeline_executor = None
+        if self.params.get('pipeline'):
+            self.pipeline_env = self._make_env(self.params.get('n_envs', 1))
+            self.pipeline_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1)
+            self._pending_rollouts = deque()
+            self.staleness = 0
+
+    def _make_env(self, index=0):
+        """
+            Create an env on the configured backend
+        """
+        return make_env(self.params.get('env_backend', 'remote'),
+                        self.params['env_creds'],
+                        seed=self.params['seed'] + index,
+                        reward_cache=self.reward_cache,
+                        budget=self.evaluation_budget)
+
     def run_training_loop(self, n_iter, collect_policy, eval_policy,
                           initial_expertdata=None, relabel_with_expert=False,
-                          start_relabel_with_expert=1, expert_policy=None):
+                          start_relabel_with_expert=1, expert_policy=None,
+                          iteration_callback=None):
         """
         :param n_iter:  number of (dagger) iterations
         :param collect_policy:
@@ -99,12 +239,26 @@ class RL_Trainer(object):
         :param relabel_with_expert:  whether to perform dagger
         :param start_relabel_with_expert: iteration at which to start relabel with expert
         :param expert_policy:
+        :param iteration_callback: called with the iteration number at the end
+            of every iteration, training stops early when it returns True
         """
 
         # init vars at beginning of training
         self.total_envsteps = 0
         self.start_time = time.time()
 
+        if self.inference_policy is not None:
+            if collect_policy is self.agent.actor:
+                collect_policy = self.inference_policy
+            if eval_policy is self.agent.actor:
+                eval_policy = self.inference_policy
+
+        # streamed episodes are in the replay buffer before relabelling
+        assert not (relabel_with_expert and self.params.get('stream_collect')), \
+            'Streaming collection does not support relabelling with an expert'
+        assert not (self.pipeline_executor is not None and self.params['parallel']), \
+            'The pipeline already collects in the background'
+
         if self.params['parallel']:
             batch_s = self.params['batch_size']
             cores = multiprocessing.cpu_count()
@@ -112,12 +266,13 @@ class RL_Trainer(object):
             rem = batch_s % cores
             batches = [batch_per_core] * cores
 
-            if rem:
-                batches[:rem] = batches[:rem] + 1
+            for i in range(rem):
+                batches[i] += 1
             print(f'Starting threading: using {cores} cores')
 
         for itr in range(n_iter):
             print("\n\n********** Iteration %i ************" % itr)
+            itr_start = time.time()
 
             # decide if videos should be rendered/logged at this iteration
             if itr % self.params['video_log_freq'] == 0 and self.params['video_log_freq'] != -1:
@@ -126,7 +281,7 @@ class RL_Trainer(object):
                 self.log_video = False
 
             # decide if metrics should be logged
-            if itr % self.params['scalar_log_freq'] == 0:
+            if itr % self.params['scalar_log_freq'] == 0 and self.params['scalar_log_freq'] != -1:
                 self.log_metrics = True
             else:
                 self.log_metrics = False
@@ -135,37 +290,61 @@ class RL_Trainer(object):
             self.val_loss = []
 
             # collect trajectories, to be used for training
-            training_returns = []
-
-            if self.params['parallel']:
-
-                with concurrent.futures.ThreadPoolExecutor(max_workers=cores) as executor:
-                    future = {
-                        executor.submit(
-                            self.collect_training_trajectories, itr, initial_expertdata, collect_policy, b_s):
-                        b_s for b_s in batches
-                    }
-
-                    for trajectory in concurrent.futures.as_completed(future):
-                        try:
-                            data = trajectory.result()
-                        except Exception as e:
-                            print(f'Generated exception : {e}')
-                        else:
-                            training_returns.append(data)
-
-                returns = np.asanyarray(training_returns)
-                training_returns = np.concatenate(returns[:,
-                                                          0]), returns[:, 1].sum(), returns[:, 2]
-                if np.any(training_returns[2]):
-                    training_returns[2] = np.concatenate(training_returns[2])
+            with timer.phase('collect'):
+                training_returns = []
+
+                # whether the agent already put the rollouts in its buffer
+                in_buffer = False
+
+                if not itr and initial_expertdata:
+                    # load once, not once per collection thread
+                    training_returns = self.load_initial_expertdata(
+                        initial_expertdata, to_buffer=relabel_with_expert)
+
+                elif self.pipeline_executor is not None:
+                    # rollouts prefetched during the previous iteration
+                    training_returns = self.collect_pipelined(
+                        itr, self.params['batch_size'], n_iter)
+
+                elif self.params.get('stream_collect'):
+                    # episodes reach the agent as soon as they finish
+                    training_returns = self.collect_streaming(
+                        collect_policy, self.params['batch_size'])
+                    in_buffer = True
+
+                elif self.params['parallel']:
+
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=cores) as executor:
+                        future = {
+                            executor.submit(
+                                self.collect_training_trajectories, itr, initial_expertdata, collect_policy, b_s):
+                            b_s for b_s in batches
+                        }
+
+                        for trajectory in concurrent.futures.as_completed(future):
+                            try:
+                                data = trajectory.result()
+                            except Exception as e:
+                                print(f'Generated exception : {e}')
+                            else:
+                                training_returns.append(data)
+
+                    video_paths = [data[2] for data in training_returns if data[2]]
+                    training_returns = (
+                        RolloutBatch.concatenate(
+                            [RolloutBatch.from_paths(data[0]) for data in training_returns]),
+                        sum(data[1] for data in training_returns),
+                        sum(video_paths, []) or None)
 
-            else:
-                training_returns = self.collect_training_trajectories(itr,
-                                                                      initial_expertdata, collect_policy,
-                                                                      self.params['batch_size'])
+                else:
+                    training_returns = self.collect_training_trajectories(itr,
+                                                                          initial_expertdata, collect_policy,
+                                                                          self.params['batch_size'])
 
             paths, envsteps_this_batch, train_video_paths = training_returns
+            # pickled expert data comes as a list of rollout dicts
+            paths = RolloutBatch.from_paths(paths)
+            self.graph_guard.check('rollouts')
             self.total_envsteps += envsteps_this_batch
 
             # relabel the collected obs with actions from a provided expert policy
@@ -173,20 +352,33 @@ class RL_Trainer(object):
                 paths = self.do_relabel_with_expert(expert_policy, paths)
 
             # add collected data to replay buffer
-            self.agent.add_to_replay_buffer(paths)
+            if len(paths) and not in_buffer:
+                self.agent.add_to_replay_buffer(paths)
 
             # train agent (using sampled data from replay buffer)
-            self.train_agent()
+            with timer.phase('train'):
+                self.train_agent()
+            self.graph_guard.check('training')
+
+            with timer.phase('weight_sync'):
+                # keep the NumPy copy of the actor in sync
+                if self.inference_policy is not None:
+                    self.inference_policy.refresh()
+
+                # send the updated weights to the rollout workers
+                if self.rollout_workers is not None:
+                    self.rollout_workers.broadcast(self.agent.actor.get_weights())
 
             # log/save
             if self.log_video or self.log_metrics:
 
                 # perform logging
                 print('\nBeginning logging procedure...')
-                if 'ushiriki' in self.params['env_name'].lower():
-                    self.log_ushiriki(eval_policy)
-                self.perform_logging(
-                    itr, paths, eval_policy, train_video_paths)
+                with timer.phase('logging'):
+                    if 'ushiriki' in self.params['env_name'].lower():
+                        self.log_ushiriki(eval_policy)
+                    self.perform_logging(
+                        itr, paths, eval_policy, train_video_paths)
 
                 if self.params['save_params']:
                     # save policy
@@ -194,6 +386,34 @@ class RL_Trainer(object):
                     self.agent.actor.save(
                         self.params['logdir'] + '/policy_itr_'+str(itr))
 
+                self.graph_guard.check('evaluation and logging')
+
+            if timer.enabled:
+                self.log_perf(itr, time.time() - itr_start)
+
+            if iteration_callback is not None and iteration_callback(itr):
+                print('\nStopped by the iteration callback after iteration {}'.format(itr))
+                break
+
+        # write out what the logger still has queued, and stop its writer
+        self.logger.close()
+
+        if self.rollout_workers is not None:
+            self.rollout_workers.close()
+
+        if self.async_collector is not None:
+            self.async_collector.close()
+
+        if self.reward_cache is not None:
+            self.reward_cache.close()
+
+        if self.rollout_store is not None:
+            self.rollout_store.close()
+
+        if tracer.enabled:
+            tracer.save(self.params['trace'])
+            print('\nTrace of the run saved to {}'.format(self.params['trace']))
+
     ####################################
     ####################################
 
@@ -204,20 +424,102 @@ class RL_Trainer(object):
         :param collect_policy:  the current policy using which we collect data
         :param batch_size:  the number of transitions we collect
         :return:
-            paths: a list trajectories
+            paths: a RolloutBatch of the trajectories
             envsteps_this_batch: the sum over the numbers of environment steps in paths
             train_video_paths: paths which also contain videos for visualization purposes
         """
 
 
         if not itr and load_initial_expertdata:
-            with open(load_initial_expertdata, 'rb') as f:
-                initial_expert_data = pickle.load(f)
-            return initial_expert_data, 0, None
+            return self.load_initial_expertdata(load_initial_expertdata)
         print("\nCollecting data to be used for training...")
-        paths, envsteps_this_batch = sample_trajectories(
+        paths, envsteps_this_batch = self.sample_with_collector(
+            self.env, collect_policy, batch_size)
+
+        return [paths, envsteps_this_batch, self.collect_video_paths(collect_policy)]
+
+    def sample_with_collector(self, env, policy, batch_size):
+        """
+            Collect at least `batch_size` steps with the configured
+            collector, `env` being the one used without a collector of
+            its own (open-loop or single env)
+        """
+        max_path_length = self.params['ep_len']
+        if self.async_collector is not None:
+            return self.async_collector.sample_trajectories(
+                policy, batch_size, max_path_length=max_path_length)
+        elif self.params.get('open_loop'):
+            return sample_trajectories_open_loop(
+                env, policy, batch_size, max_path_length=max_path_length)
+        elif self.rollout_workers is not None:
+            return self.rollout_workers.sample_trajectories(
+                batch_size, max_path_length=max_path_length)
+        elif self.vec_env is not None:
+            return sample_trajectories_vec(
+                self.vec_env, policy, batch_size, max_path_length=max_path_length)
+        return sample_trajectories(
+            env, policy, batch_size, max_path_length=max_path_length)
+
+    def collect_streaming(self, collect_policy, batch_size):
+        """
+            Collect rollouts in the background and hand each finished
+            episode to the agent, which adds it to its replay buffer
+
+            returns the same as collect_training_trajectories
+        """
+        print("\nStreaming data to be used for training...")
+        stream = stream_trajectories(
             self.env, collect_policy, batch_size, max_path_length=self.params['ep_len'])
+        paths, envsteps_this_batch = self.agent.consume_stream(stream)
+        return [paths, envsteps_this_batch, self.collect_video_paths(collect_policy)]
 
+    def collect_pipelined(self, itr, batch_size, n_iter):
+        """
+            Take the oldest batch of rollouts collected in the background,
+            then queue the collection of the next ones with a NumPy
+            snapshot of the current weights
+
+            At most `max_staleness` batches are queued, so rollouts are at
+            most that many iterations old. The agent is told which policy
+            collected them, to correct stale ones.
+
+            returns the same as collect_training_trajectories
+        """
+        if self._pending_rollouts:
+            future, snapshot_itr, behavior_policy = self._pending_rollouts.popleft()
+            paths, envsteps_this_batch = future.result()
+            self.staleness = itr - snapshot_itr
+        else:
+            print("\nCollecting data to be used for training...")
+            behavior_policy = self._policy_snapshot(itr)
+            paths, envsteps_this_batch = self._collect_in_background(
+                behavior_policy, batch_size)
+            self.staleness = 0
+
+        if hasattr(self.agent, 'set_behavior_policy'):
+            self.agent.set_behavior_policy(
+                behavior_policy if self.staleness else None)
+
+        # one batch per remaining iteration at most
+        n_queued = min(self.params.get('max_staleness', 1), n_iter - itr - 1)
+        if len(self._pending_rollouts) < n_queued:
+            snapshot = self._policy_snapshot(itr)
+            while len(self._pending_rollouts) < n_queued:
+                self._pending_rollouts.append((
+                    self.pipeline_executor.submit(
+                        self._collect_in_background, snapshot, batch_size),
+                    itr, snapshot))
+
+        return [paths, envsteps_this_batch, None]
+
+    def _policy_snapshot(self, itr):
+        return NumpyMLPPolicy(self.agent.actor.get_weights(),
+                              seed=self.params['seed'] + itr)
+
+    def _collect_in_background(self, policy, batch_size):
+        return self.sample_with_collector(self.pipeline_env, policy, batch_size)
+
+    def collect_video_paths(self, collect_policy):
         # note: here, we collect MAX_NVIDEO rollouts, each of length MAX_VIDEO_LEN
         train_video_paths = None
         if self.log_video:
@@ -225,8 +527,35 @@ class RL_Trainer(object):
             # : look in utils and implement sample_n_trajectories
             train_video_paths = sample_n_trajectories(
                 self.env, collect_policy, MAX_NVIDEO, MAX_VIDEO_LEN, True)
+        return train_video_paths
+
+    def load_initial_expertdata(self, expertdata, to_buffer=False):
+        """
+            Load expert rollouts, either pickled or columnar
 
-        return [paths, envsteps_this_batch, train_video_paths]
+            An agent that can train from a columnar dataset (set_expert_data)
+            reads it from disk, unless `to_buffer`, e.g. to mix it with
+            relabelled rollouts. Otherwise it is streamed straight into the
+            replay buffer, a batch of episodes at a time. No paths are
+            returned for it either way.
+        """
+        if not is_columnar(expertdata):
+            with open(expertdata, 'rb') as f:
+                initial_expert_data = pickle.load(f)
+            return initial_expert_data, 0, None
+
+        reader = ExpertDataReader(expertdata)
+        if not to_buffer and hasattr(self.agent, 'set_expert_data'):
+            print('\nTraining on {} expert steps read from {}...'.format(
+                reader.num_steps, expertdata))
+            self.agent.set_expert_data(reader)
+        else:
+            print('\nStreaming {} expert steps into the replay buffer...'.format(
+                reader.num_steps))
+            for paths in reader.iter_paths(self.params.get('expert_batch_size', 10000)):
+                self.agent.add_to_replay_buffer(paths)
+        self.initial_return = np.mean(reader.episode_returns())
+        return [], 0, None
 
     def train_agent(self):
         print('\nTraining agent using sampled data from replay buffer...')
@@ -254,8 +583,9 @@ class RL_Trainer(object):
 
         print("\nRelabelling collected observations with labels from an expert policy...")
 
-        for path in paths:
-            path['action'] = expert_policy.get_action(path['observation'])
+        # all observations of the batch in one query
+        paths.action = np.asarray(
+            expert_policy.get_action(paths.observation), dtype=np.float32)
 
         return paths
 
@@ -268,18 +598,36 @@ class RL_Trainer(object):
         """
         self.best_rews = []
         candidates = []
-        for step in range(self.params['eval_ep_lens']):
-            ob = self.env.reset()
+        for step in range(self.params.get('eval_ep_lens', 20)):
+            self.env.reset()
             policy = {}
 
-            for i in range(self.env.policyDimension):
-                policy[step + i] = eval_policy.get_action(ob)[0]
-                candidates.append(policy)
-            rew = self.env.evaluatePolicy(candidates)
-            best_idx = np.armax(rew)
-            best_policy = candidates[best_idx]
-            best_rew = rew[best_idx]
-        self.best_rews.append(best_rew)
+            for year in range(1, self.env.policyDimension + 1):
+                ac = eval_policy.get_action(np.array([year]))[0]
+                policy[str(year)] = [float(a) for a in ac]
+            candidates.append(policy)
+        rew = self.env.evaluatePolicy(candidates)
+        best_idx = np.argmax(rew)
+        self.best_policy = candidates[best_idx]
+        self.best_rews.append(rew[best_idx])
+
+    def log_perf(self, itr, itr_time):
+        """
+            Log the phase timings and counters of this iteration, as
+            `Perf/` scalars and as a line of perf_summary.jsonl, and reset them
+        """
+        summary = timer.summary()
+        for name, stats in summary['phases'].items():
+            self.logger.log_scalar(stats['seconds'], 'Perf/{}_secs'.format(name), itr)
+            self.logger.log_scalar(stats['calls'], 'Perf/{}_calls'.format(name), itr)
+        for name, count in summary['counters'].items():
+            self.logger.log_scalar(count, 'Perf/{}'.format(name), itr)
+        self.logger.log_scalar(itr_time, 'Perf/iteration_secs', itr)
+
+        summary.update(itr=itr, iteration_secs=itr_time)
+        with open(os.path.join(self.params['logdir'], 'perf_summary.jsonl'), 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+        timer.reset()
 
     def perform_logging(self, itr, paths, eval_policy, train_video_paths):
 
@@ -304,14 +652,12 @@ class RL_Trainer(object):
         # save eval metrics
         if self.log_metrics:
             # returns, for logging
-            train_returns = [path["reward"].sum() for path in paths]
-            eval_returns = [eval_path["reward"].sum()
-                            for eval_path in eval_paths]
+            train_returns = paths.episode_returns()
+            eval_returns = eval_paths.episode_returns()
 
             # episode lengths, for logging
-            train_ep_lens = [len(path["reward"]) for path in paths]
-            eval_ep_lens = [len(eval_path["reward"])
-                            for eval_path in eval_paths]
+            train_ep_lens = paths.episode_lengths()
+            eval_ep_lens = eval_paths.episode_lengths()
 
             # decide what to log
             logs = OrderedDict()
@@ -321,11 +667,13 @@ class RL_Trainer(object):
             logs["Eval_MinReturn"] = np.min(eval_returns)
             logs["Eval_AverageEpLen"] = np.mean(eval_ep_lens)
 
-            logs["Train_AverageReturn"] = np.mean(train_returns)
-            logs["Train_StdReturn"] = np.std(train_returns)
-            logs["Train_MaxReturn"] = np.max(train_returns)
-            logs["Train_MinReturn"] = np.min(train_returns)
-            logs["Train_AverageEpLen"] = np.mean(train_ep_lens)
+            # streamed expert data leaves no paths to report on
+            if len(train_returns):
+                logs["Train_AverageReturn"] = np.mean(train_returns)
+                logs["Train_StdReturn"] = np.std(train_returns)
+                logs["Train_MaxReturn"] = np.max(train_returns)
+                logs["Train_MinReturn"] = np.min(train_returns)
+                logs["Train_AverageEpLen"] = np.mean(train_ep_lens)
 
             logs["Train_EnvstepsSoFar"] = self.total_envsteps
             logs["TimeSinceStart"] = time.time() - self.start_time
@@ -335,7 +683,25 @@ class RL_Trainer(object):
             if self.val_loss:
                 logs['Value_loss_Average'] = np.mean(self.val_loss)
 
-            if itr == 0:
+            if self.agent.actor.memoize_actions:
+                memo_stats = self.agent.actor.memo_stats()
+                logs['ActionMemo_Hits'] = memo_stats['hits']
+                logs['ActionMemo_Misses'] = memo_stats['misses']
+
+            if self.pipeline_executor is not None:
+                logs['Pipeline_Staleness'] = self.staleness
+
+            if self.reward_cache is not None:
+                cache_stats = self.reward_cache.stats()
+                logs['RewardCache_Hits'] = cache_stats['hits']
+                logs['RewardCache_Misses'] = cache_stats['misses']
+                logs['RewardCache_HitRate'] = cache_stats['hit_rate']
+
+            logs['Evaluations_Spent'] = self.evaluation_budget.spent
+            if self.evaluation_budget.limit is not None:
+                logs['Evaluations_Remaining'] = self.evaluation_budget.remaining
+
+            if itr == 0 and len(train_returns):
                 self.initial_return = np.mean(train_returns)
             logs["Initial_DataCollection_AverageReturn"] = self.initial_return
 
@@ -345,4 +711,6 @@ class RL_Trainer(object):
                 self.logger.log_scalar(value, key, itr)
             print('Done logging...\n\n')
 
-            self.logger.flush()
+            # the async writer flushes on its own schedule
+            if not self.params.get('async_logging'):
+                self.logger.flush()
@@ -0,0 +1,222 @@
+"""
+    Persistent on-disk store of rollouts
+
+    Steps are written to fixed-size segment files mapped with `np.memmap`,
+    one file per field, and every episode gets a (segment, offset, length)
+    record in an append-only index. An episode only becomes visible once
+    its index record is written, after its data was flushed, so a run that
+    dies mid-append leaves the store readable up to the last whole episode.
+    Reads map the segments and the index lazily: only the touched pages
+    are loaded, which keeps histories much larger than RAM usable.
+"""
+import json
+import os
+
+import numpy as np
+
+FIELDS = ('observation', 'action', 'reward', 'next_observation', 'terminal')
+
+# one index record per episode: segment, offset, length
+_RECORD = np.dtype([('segment', np.int64), ('offset', np.int64),
+                    ('length', np.int64)])
+
+# index records read at a time when walking back from the newest episode
+_INDEX_CHUNK = 4096
+
+
+class RolloutStore(object):
+    """
+        Append-only rollout store in `root_dir`
+
+        Episodes never span segments, so `segment_steps` bounds the length
+        of an episode. Field shapes are taken from the first append and
+        kept in `store.json`, along with the segment size. A store has a
+        single writer, any number of processes may read it.
+
+        The index is fsynced every `sync_every` appends, and on close: an
+        OS crash or power loss may lose the last sync_every - 1 appends,
+        a crash of the writing process loses none.
+    """
+
+    def __init__(self, root_dir, segment_steps=1000000, sync_every=1):
+        self.root_dir = root_dir
+        self.sync_every = max(1, sync_every)
+        self._unsynced = 0
+        os.makedirs(root_dir, exist_ok=True)
+
+        self._meta_path = os.path.join(root_dir, 'store.json')
+        self._index_path = os.path.join(root_dir, 'episodes.idx')
+        self.shapes = None
+        self.segment_steps = segment_steps
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            self.segment_steps = meta['segment_steps']
+            self.shapes = {name: tuple(shape)
+                           for name, shape in meta['shapes'].items()}
+
+        self.index = self._read_index()
+        self._segments = {}
+
+    def _read_index(self, n_records=None):
+        """
+            Read-only memmap of the first `n_records` index records,
+            by default of all the whole records in the file
+        """
+        if n_records is None:
+            if not os.path.exists(self._index_path):
+                return np.zeros(0, dtype=_RECORD)
+            # a torn trailing record (crash mid-write) is not committed
+            n_records = os.path.getsize(self._index_path) // _RECORD.itemsize
+        if not n_records:
+            return np.zeros(0, dtype=_RECORD)
+        return np.memmap(self._index_path, dtype=_RECORD, mode='r',
+                         shape=(n_records,))
+
+    def __len__(self):
+        """
+            Number of stored episodes
+        """
+        return len(self.index)
+
+    @property
+    def num_steps(self):
+        return int(self.index['length'].sum())
+
+    ##################################
+
+    def _segment_file(self, segment, name):
+        return os.path.join(self.root_dir, 'segment_{:06d}'.format(segment),
+                            name + '.f32')
+
+    def _segment(self, segment):
+        """
+            Memmaps of the fields of a segment, keyed by field name,
+            creating its files on first use
+        """
+        if segment not in self._segments:
+            create = not os.path.exists(self._segment_file(segment, FIELDS[0]))
+            if create:
+                os.makedirs(os.path.dirname(
+                    self._segment_file(segment, FIELDS[0])), exist_ok=True)
+            self._segments[segment] = {
+                name: np.memmap(self._segment_file(segment, name),
+                                dtype=np.float32,
+                                mode='w+' if create else 'r+',
+                                shape=(self.segment_steps,) + self.shapes[name])
+                for name in FIELDS}
+        return self._segments[segment]
+
+    def _write_meta(self, paths):
+        self.shapes = {name: np.shape(paths[0][name])[1:] for name in FIELDS}
+        with open(self._meta_path, 'w') as f:
+            json.dump({'segment_steps': self.segment_steps,
+                       'shapes': {name: list(shape)
+                                  for name, shape in self.shapes.items()}}, f)
+
+    def append(self, paths):
+        """
+            Write a list of rollouts and commit them to the index
+        """
+        if not len(paths):
+            return
+        if self.shapes is None:
+            self._write_meta(paths)
+
+        # the next free step is right after the last committed episode,
+        # anything written past it was never committed
+        if len(self.index):
+            segment, offset, length = self.index[-1]
+            segment, offset = int(segment), int(offset + length)
+        else:
+            segment, offset = 0, 0
+
+        records = []
+        touched = set()
+        for path in paths:
+            length = len(path['reward'])
+            if length > self.segment_steps:
+                raise ValueError('Episode of {} steps does not fit in segments '
+                                 'of {} steps'.format(length, self.segment_steps))
+            if offset + length > self.segment_steps:
+                segment, offset = segment + 1, 0
+
+            arrays = self._segment(segment)
+            for name in FIELDS:
+                arrays[name][offset:offset + length] = np.reshape(
+                    path[name], (length,) + self.shapes[name])
+            records.append((segment, offset, length))
+            touched.add(segment)
+            offset += length
+
+        # data first, then the index records that commit it
+        for segment in touched:
+            for array in self._segment(segment).values():
+                array.flush()
+        records = np.array(records, dtype=_RECORD)
+        with open(self._index_path, 'ab') as f:
+            # drop a torn record left by a crashed writer
+            f.truncate(self.index.nbytes)
+            f.write(records.tobytes())
+            f.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                os.fsync(f.fileno())
+                self._unsynced = 0
+        # map the grown file, nothing of the index is read here
+        self.index = self._read_index(len(self.index) + len(records))
+
+    ##################################
+
+    def episode(self, i):
+        """
+            Rollout dict of episode i, as views of the mapped segments
+        """
+        segment, offset, length = (int(v) for v in self.index[i])
+        arrays = self._segment(segment)
+        path = {name: arrays[name][offset:offset + length] for name in FIELDS}
+        path['image_obs'] = np.array([], dtype=np.uint8)
+        return path
+
+    def recent_episodes(self, max_steps):
+        """
+            Index of the first of the most recent episodes that together
+            hold at most `max_steps` steps
+        """
+        # walk back a chunk of records at a time, only as far as needed
+        total, stop = 0, len(self.index)
+        while stop > 0:
+            start = max(0, stop - _INDEX_CHUNK)
+            lengths = total + np.cumsum(self.index['length'][start:stop][::-1])
+            n_fit = int(np.searchsorted(lengths, max_steps, side='right'))
+            if n_fit < stop - start:
+                return stop - n_fit
+            total, stop = int(lengths[-1]), start
+        return 0
+
+    def iter_batches(self, batch_steps, start=0, stop=None):
+        """
+            Yield lists of whole episodes from `start` to `stop`, each with
+            about `batch_steps` steps, copied into memory one batch at a time
+        """
+        stop = len(self.index) if stop is None else stop
+        batch, n_steps = [], 0
+        for i in range(start, stop):
+            path = {name: np.array(value) for name, value in self.episode(i).items()}
+            batch.append(path)
+            n_steps += len(path['reward'])
+            if n_steps >= batch_steps:
+                yield batch
+                batch, n_steps = [], 0
+        if batch:
+            yield batch
+
+    def close(self):
+        for arrays in self._segments.values():
+            for array in arrays.values():
+                array.flush()
+        self._segments = {}
+        if self._unsynced:
+            with open(self._index_path, 'ab') as f:
+                os.fsync(f.fileno())
+            self._unsynced = 0
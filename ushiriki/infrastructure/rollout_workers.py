@@ -0,0 +1,160 @@
+"""
+    Multi-process rollout collection
+
+    Each worker process owns its own env and a NumPy copy of the policy,
+    so collection is neither bound by the GIL nor by the learner's
+    TF session. The learner broadcasts new policy weights after every
+    update into an array shared with the workers, so tasks only carry the
+    weights' version, and the workers return finished rollouts, along
+    with their trace events when tracing.
+"""
+import multiprocessing
+
+import numpy as np
+
+from ushiriki.infrastructure.env_utils import make_env
+from ushiriki.infrastructure.reward_cache import RewardCache
+from ushiriki.infrastructure.utils import sample_trajectory, RolloutBatch
+from ushiriki.infrastructure.tracer import tracer
+from ushiriki.policies.numpy_policy import NumpyMLPPolicy
+
+
+# per-process state of a rollout worker
+_worker = {}
+
+
+def _weights_layout(weights):
+    """
+        (name, shape, offset) of every variable in a flat float32 array,
+        and the size of that array
+    """
+    layout, offset = [], 0
+    for name in sorted(weights):
+        shape = np.shape(weights[name])
+        layout.append((name, shape, offset))
+        offset += int(np.prod(shape))
+    return layout, offset
+
+
+def _init_worker(env_params, seed, shared_weights, layout, counter):
+    # 1, 2, ... in start order, also for workers replacing dead ones
+    with counter.get_lock():
+        counter.value += 1
+        index = counter.value
+
+    if env_params.get('trace'):
+        tracer.enabled = True
+        tracer.set_process_name('rollout_worker_{}'.format(index))
+
+    reward_cache = None
+    if env_params.get('reward_cache'):
+        reward_cache = RewardCache(env_params['reward_cache'],
+                                   quantum=env_params['cache_quantum'],
+                                   max_entries=env_params['cache_size'])
+
+    _worker['env'] = make_env(env_params['env_backend'],
+                              env_params['env_creds'],
+                              seed=seed + index,
+                              reward_cache=reward_cache)
+    _worker['seed'] = seed + index
+    _worker['weights'] = np.frombuffer(shared_weights, dtype=np.float32)
+    _worker['layout'] = layout
+    _worker['policy'] = None
+    _worker['version'] = None
+
+
+def _read_weights():
+    flat = _worker['weights']
+    return {name: flat[offset:offset + int(np.prod(shape))].reshape(shape).copy()
+            for name, shape, offset in _worker['layout']}
+
+
+def _sample_trajectories(version, n_episodes, max_path_length):
+    # only reload the policy when the learner has broadcast new weights
+    if _worker['version'] != version:
+        if _worker['policy'] is None:
+            _worker['policy'] = NumpyMLPPolicy(_read_weights(),
+                                               seed=_worker['seed'])
+        else:
+            _worker['policy'].set_weights(_read_weights())
+        _worker['version'] = version
+
+    # one columnar batch per task is cheaper to send back than the dicts
+    batch = RolloutBatch.from_paths(
+        [sample_trajectory(_worker['env'], _worker['policy'], max_path_length)
+         for _ in range(n_episodes)])
+    return batch, tracer.drain()
+
+
+def split_episodes(n_episodes, n_workers):
+    """
+        Split n_episodes as evenly as possible over n_workers
+    """
+    per_worker, rem = divmod(n_episodes, n_workers)
+    return [per_worker + 1 if i < rem else per_worker
+            for i in range(n_workers)]
+
+
+class RolloutWorkerPool(object):
+    """
+        Pool of rollout worker processes
+
+        env_params: 'env_backend' and 'env_creds' to build each worker's env,
+            and optionally 'reward_cache', 'cache_quantum', 'cache_size'
+        weights: the initial policy weights, which also fix the layout of
+            the array shared with the workers
+    """
+
+    def __init__(self, n_workers, env_params, weights, seed=0):
+        self.n_workers = n_workers
+
+        # spawn, so workers don't inherit the learner's TF runtime
+        ctx = multiprocessing.get_context('spawn')
+        self._layout, size = _weights_layout(weights)
+        self._shared = ctx.RawArray('f', size)
+        self._version = 0
+        self.broadcast(weights)
+
+        # hands out the worker indices, which seed the workers' envs
+        self._worker_counter = ctx.Value('i', 0)
+        self._pool = ctx.Pool(n_workers,
+                              initializer=_init_worker,
+                              initargs=(env_params, seed, self._shared,
+                                        self._layout, self._worker_counter))
+
+    def broadcast(self, weights):
+        """
+            Set the policy weights used from the next collection on
+
+            Workers only read the shared weights during sample_trajectories,
+            so they are not overwritten while in use.
+        """
+        flat = np.frombuffer(self._shared, dtype=np.float32)
+        for name, shape, offset in self._layout:
+            flat[offset:offset + int(np.prod(shape))] = \
+                np.ravel(weights[name])
+        self._version += 1
+
+    def sample_trajectories(self, min_timesteps_per_batch, max_path_length):
+        """
+            Collect rollouts until we have collected min_timesteps_per_batch steps,
+            split over the workers in whole episodes
+        """
+        timesteps_this_batch = 0
+        batches = []
+        while timesteps_this_batch < min_timesteps_per_batch:
+            n_episodes = -(-(min_timesteps_per_batch - timesteps_this_batch)
+                           // max_path_length)
+            tasks = [(self._version, n, max_path_length)
+                     for n in split_episodes(n_episodes, self.n_workers) if n]
+
+            for batch, events in self._pool.starmap(_sample_trajectories, tasks):
+                tracer.extend(events)
+                batches.append(batch)
+                timesteps_this_batch += batch.num_steps
+
+        return RolloutBatch.concatenate(batches), timesteps_this_batch
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
@@ -1,6 +1,8 @@
 import tensorflow as tf
 import os
 
+from ushiriki.infrastructure.tracer import tracer
+
 ############################################
 ############################################
 
@@ -42,7 +44,19 @@ def build_mlp(input_placeholder, output_size, scope, n_layers, size, activation=
 ############################################
 
 
-def create_tf_session(use_gpu, gpu_frac=0.6, allow_gpu_growth=True, which_gpu=0):
+class TracedSession(tf.Session):
+    """
+        Session recording a trace span for every run call
+    """
+
+    def run(self, fetches, feed_dict=None, options=None, run_metadata=None):
+        with tracer.span('sess.run', 'tf'):
+            return super(TracedSession, self).run(
+                fetches, feed_dict=feed_dict, options=options,
+                run_metadata=run_metadata)
+
+
+def create_tf_session(use_gpu, gpu_frac=0.6, allow_gpu_growth=True, which_gpu=0, traced=False):
     if use_gpu:
         # gpu options
         gpu_options = tf.GPUOptions(
@@ -62,9 +76,38 @@ def create_tf_session(use_gpu, gpu_frac=0.6, allow_gpu_growth=True, which_gpu=0)
         config = tf.ConfigProto(device_count={'GPU': 0})
 
     # use config to create TF session
-    sess = tf.Session(config=config)
+    session_class = TracedSession if traced else tf.Session
+    sess = session_class(config=config)
     return sess
 
+def finalize_graph(sess):
+    """
+        Freeze the graph of the session, so that adding any op raises
+    """
+    sess.graph.finalize()
+    return GraphSizeGuard(sess.graph)
+
+
+class GraphSizeGuard(object):
+    """
+        Fails fast if ops are added to a graph after construction,
+        e.g. from a per-call tf op inside get_action
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.version = graph.version
+
+    def check(self, where=''):
+        if self.graph.version != self.version:
+            raise RuntimeError(
+                '{} ops were added to the graph after construction{}'.format(
+                    self.graph.version - self.version,
+                    ' (during {})'.format(where) if where else ''))
+
+############################################
+############################################
+
 def lrelu(x, leak=0.2):
     f1 = 0.5 * (1 + leak)
     f2 = 0.5 * (1 - leak)
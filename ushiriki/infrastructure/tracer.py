@@ -0,0 +1,135 @@
+"""
+    Timeline of a run in Chrome trace-event format
+
+    Spans are recorded as complete ('X') events tagged with the process
+    and thread that ran them, or as async begin/end pairs for requests
+    that overlap on one thread (asyncio). The saved JSON opens in
+    chrome://tracing or Perfetto. Every `profiler.timer.phase` is also a
+    span, so the instrumented phases show up on the timeline.
+
+    Like the profiler, the module-level `tracer` is off by default and
+    then only costs a method call per span.
+"""
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+
+
+def _now_us():
+    # wall clock, comparable across worker processes
+    return time.time() * 1e6
+
+
+class _Span(object):
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.complete(self.name, self.cat, self.start,
+                             _now_us() - self.start, self.args)
+        return False
+
+
+class _AsyncSpan(_Span):
+    __slots__ = ('id',)
+
+    def __enter__(self):
+        self.id = next(self.tracer._ids)
+        self.tracer._record(self.name, self.cat, 'b', _now_us(),
+                            id=self.id, args=self.args)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer._record(self.name, self.cat, 'e', _now_us(), id=self.id)
+        return False
+
+
+class Tracer(object):
+    """
+        In-memory list of trace events, written out by `save`
+
+        Worker processes `drain` their events and send them to the
+        learner, which merges them with `extend`.
+    """
+
+    _disabled = contextlib.nullcontext()
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._events = []
+        self._threads = set()
+
+    def span(self, name, cat='phase', **args):
+        if not self.enabled:
+            return self._disabled
+        return _Span(self, name, cat, args)
+
+    def async_span(self, name, cat='phase', **args):
+        """
+            Span of an operation that overlaps others on the same thread
+        """
+        if not self.enabled:
+            return self._disabled
+        return _AsyncSpan(self, name, cat, args)
+
+    def complete(self, name, cat, start, duration, args=None):
+        """
+            Record a span from its start and duration, in microseconds
+        """
+        self._record(name, cat, 'X', start, dur=duration, args=args)
+
+    def _record(self, name, cat, ph, ts, args=None, **fields):
+        thread = threading.current_thread()
+        event = dict(name=name, cat=cat, ph=ph, ts=ts, pid=os.getpid(),
+                     tid=thread.ident, **fields)
+        if args:
+            event['args'] = args
+        with self._lock:
+            if (event['pid'], thread.ident) not in self._threads:
+                self._threads.add((event['pid'], thread.ident))
+                self._events.append(dict(
+                    name='thread_name', ph='M', pid=event['pid'],
+                    tid=thread.ident, args={'name': thread.name}))
+            self._events.append(event)
+
+    def set_process_name(self, name):
+        with self._lock:
+            self._events.append(dict(name='process_name', ph='M',
+                                     pid=os.getpid(), args={'name': name}))
+
+    def drain(self):
+        """
+            Hand over the recorded events, e.g. to send them to the learner
+        """
+        with self._lock:
+            events, self._events = self._events, []
+            self._threads = set()
+        return events
+
+    def extend(self, events):
+        with self._lock:
+            self._events.extend(events)
+
+    def save(self, path):
+        with self._lock:
+            events = list(self._events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# shared by all instrumented code
+tracer = Tracer()
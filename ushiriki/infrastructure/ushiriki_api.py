@@ -0,0 +1,74 @@
+"""
+    Wire format of the Ushiriki challenge REST API, as spoken by
+    ChallengeEnvironment (ushiriki-policy-engine-library)
+
+    An action is evaluated in two requests. The actions of the episode so
+    far are posted to CREATE_PATH as an `actionSeries`, which is answered
+    with the id of the evaluation; its reward is then fetched by posting
+    that `actionId` to REWARD_PATH. Both responses are JSON objects with a
+    `statusCode`, ACCEPTED on success, and the result in `data`. A whole
+    policy is evaluated by the client one action at a time.
+
+    These routes and fields follow the published client as we know it and
+    were not checked against the hosted service. They are kept in this
+    module only, so they can be fixed in one place.
+"""
+
+CREATE_PATH = '/api/action/create'
+REWARD_PATH = '/api/action/get'
+
+# statusCode of a successful response
+ACCEPTED = 202
+
+HEADERS = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+
+def create_payload(actions, environment_id=None):
+    """
+        Body of an action evaluation
+
+        actions: the actions of the episode so far, oldest first, the one
+            to evaluate last
+    """
+    payload = {'actionSeries': [{'time': year, 'ITN': float(ac[0]), 'IRS': float(ac[1])}
+                                for year, ac in enumerate(actions, 1)]}
+    if environment_id is not None:
+        payload['environmentId'] = environment_id
+    return payload
+
+
+def reward_payload(action_id):
+    return {'actionId': action_id}
+
+
+def parse_action_series(series):
+    """
+        Actions of an `actionSeries`, oldest first, from either
+        `{'time', 'ITN', 'IRS'}` records or `[ITN, IRS]` pairs
+
+        raises ValueError unless the series covers the years 1..n
+    """
+    if not series:
+        raise ValueError('Empty action series')
+    if all(isinstance(ac, dict) for ac in series):
+        series = sorted(series, key=lambda ac: int(ac.get('time', 0)))
+        years = [int(ac['time']) for ac in series if 'time' in ac]
+        if years and years != list(range(1, len(series) + 1)):
+            raise ValueError('Action series for years {}'.format(years))
+        return [[float(ac['ITN']), float(ac['IRS'])] for ac in series]
+    return [[float(a) for a in ac] for ac in series]
+
+
+def response(data, status=ACCEPTED):
+    return {'statusCode': status, 'data': data}
+
+
+def parse_data(body):
+    """
+        Result of a decoded JSON response
+
+        raises ValueError if its statusCode is not ACCEPTED
+    """
+    if body.get('statusCode') != ACCEPTED:
+        raise ValueError('Request failed: {}'.format(body))
+    return body['data']
@@ -0,0 +1,366 @@
+"""
+    Local stand-in for the Ushiriki challenge REST API
+
+    Serves the routes ChallengeEnvironment requests (see ushiriki_api)
+    over HTTP, so the remote backend can be run and load tested with
+    `--baseuri http://localhost:<port>` without the hosted service.
+    Requests can be slowed down by a latency distribution, failed at a
+    given rate, and limited in concurrency. Responses come from one of:
+
+        simulate: the local simulator (LocalUshirikiEnvironment)
+        record: the real service at `upstream`, every exchange being
+            appended to a cassette file
+        replay: a cassette recorded earlier, keyed by method, path and
+            body, the `userID` of the body left out
+
+    Start it with
+        python -m ushiriki.infrastructure.ushiriki_server --port 8080 \\
+            --latency lognormal --latency_ms 80 --error_rate .01
+"""
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from ushiriki.infrastructure import ushiriki_api
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+
+MODES = ('simulate', 'record', 'replay')
+LATENCIES = ('none', 'constant', 'uniform', 'exponential', 'lognormal')
+
+
+def _error(status, message):
+    # errors carry a statusCode too, like the service's responses
+    return status, {'statusCode': status, 'error': message}
+
+
+class LatencyModel(object):
+    """
+        Random delay of every response, in seconds
+
+        mean_ms is the mean delay; spread is the half width relative to
+        the mean for 'uniform', and the sigma of the log for 'lognormal'.
+    """
+
+    def __init__(self, distribution='none', mean_ms=0., spread=.5, seed=None):
+        assert distribution in LATENCIES, \
+            'Unknown latency distribution {}'.format(distribution)
+        self.distribution = distribution
+        self.mean = mean_ms / 1000.
+        self.spread = spread
+        self._lock = threading.Lock()
+        self._rng = np.random.RandomState(seed)
+
+    def sample(self):
+        if self.distribution == 'none' or self.mean <= 0:
+            return 0.
+        with self._lock:
+            if self.distribution == 'constant':
+                return self.mean
+            if self.distribution == 'uniform':
+                return self.mean * self._rng.uniform(1 - self.spread, 1 + self.spread)
+            if self.distribution == 'exponential':
+                return self._rng.exponential(self.mean)
+            # lognormal with the given mean
+            return self.mean * self._rng.lognormal(-self.spread ** 2 / 2, self.spread)
+
+
+class Cassette(object):
+    """
+        Recorded exchanges, one JSON object per line, appended as they happen
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._responses = {}
+
+    @staticmethod
+    def key(method, path, body):
+        # the same request serialized with another key order, or sent by
+        # another user, still matches
+        try:
+            payload = json.loads(body or 'null')
+            if isinstance(payload, dict):
+                payload.pop('userID', None)
+            body = json.dumps(payload, sort_keys=True)
+        except ValueError:
+            body = body.decode('utf-8', 'replace') if isinstance(body, bytes) else body
+        return '{} {} {}'.format(method, path, body)
+
+    def load(self):
+        with open(self.path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._responses[record['key']] = (record['status'],
+                                                      record['response'])
+        return len(self._responses)
+
+    def lookup(self, key):
+        return self._responses.get(key)
+
+    def append(self, key, status, response):
+        with self._lock:
+            self._responses[key] = (status, response)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'key': key, 'status': status,
+                                    'response': response}) + '\n')
+
+
+class UshirikiServer(ThreadingHTTPServer):
+    """
+        Threaded HTTP server answering the challenge API endpoints
+
+        At most `max_concurrency` requests are served at once; the others
+        wait up to `queue_timeout` seconds for a slot, and are then
+        answered 429. A fraction `error_rate` of the requests fail with
+        `error_status`. Counters of served, failed and rejected requests
+        are returned by GET /stats/.
+
+        Rewards simulated for CREATE_PATH are kept, by action id, until
+        the server stops.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, mode='simulate', latency=None, error_rate=0.,
+                 error_status=503, max_concurrency=None, queue_timeout=0.,
+                 cassette=None, upstream=None, noise=0., seed=None,
+                 verbose=False):
+        assert mode in MODES, 'Unknown mode {}'.format(mode)
+        assert mode == 'simulate' or cassette, \
+            'The {} mode needs a cassette file'.format(mode)
+        assert mode != 'record' or upstream, 'The record mode needs an upstream'
+        super(UshirikiServer, self).__init__(address, UshirikiRequestHandler)
+
+        self.mode = mode
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.queue_timeout = queue_timeout
+        self.slots = threading.BoundedSemaphore(max_concurrency) \
+            if max_concurrency else None
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.verbose = verbose
+
+        self.cassette = Cassette(cassette) if cassette else None
+        if mode == 'replay':
+            self.cassette.load()
+
+        # the simulator is shared by all handler threads
+        self.env = LocalUshirikiEnvironment(noise=noise, seed=seed)
+        self.env_lock = threading.Lock()
+        self._rng = np.random.RandomState(seed)
+        self._rng_lock = threading.Lock()
+        self._rewards = {}
+        self._action_ids = itertools.count(1)
+        self._rewards_lock = threading.Lock()
+
+        self.stats = defaultdict(int)
+        self.stats_lock = threading.Lock()
+
+    @property
+    def baseuri(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._rng_lock:
+            return self._rng.uniform() < self.error_rate
+
+    def start(self):
+        """
+            Serve from a daemon thread, until `shutdown`
+
+            returns the base URI to give the clients
+        """
+        thread = threading.Thread(target=self.serve_forever,
+                                  name='ushiriki_server', daemon=True)
+        thread.start()
+        return self.baseuri
+
+    ##################################
+
+    def create_evaluation(self, payload):
+        """
+            Simulate the last action of an `actionSeries`, keeping its
+            reward for REWARD_PATH
+
+            returns the action id
+        """
+        actions = np.array(ushiriki_api.parse_action_series(
+            payload['actionSeries']), dtype=np.float64)
+        if actions.ndim != 2 or actions.shape[1] != self.env.actionDimension:
+            raise ValueError('Actions of shape {}'.format(actions.shape))
+        with self.env_lock:
+            rewards = self.env.evaluate_actions_batch(actions[None])
+        with self._rewards_lock:
+            action_id = str(next(self._action_ids))
+            self._rewards[action_id] = float(rewards[0, -1])
+        return action_id
+
+    def reward(self, action_id):
+        """
+            Reward of an action id, None if unknown
+        """
+        with self._rewards_lock:
+            return self._rewards.get(str(action_id))
+
+    def forward(self, method, path, body):
+        """
+            Send a request upstream, returning its status and decoded body
+        """
+        request = urllib.request.Request(
+            self.upstream + path, data=body or None, method=method,
+            headers=ushiriki_api.HEADERS)
+        try:
+            with urllib.request.urlopen(request) as resp:
+                return resp.status, json.loads(resp.read() or 'null')
+        except urllib.error.HTTPError as e:
+            content = e.read()
+            try:
+                return e.code, json.loads(content or 'null')
+            except ValueError:
+                return _error(e.code, content.decode('utf-8', 'replace'))
+        except urllib.error.URLError as e:
+            return _error(502, 'Upstream unreachable: {}'.format(e.reason))
+
+
+class UshirikiRequestHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, as the pooled clients expect
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            with self.server.stats_lock:
+                stats = dict(self.server.stats)
+            return self._reply(200, stats)
+        self._handle('GET', b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._handle('POST', self.rfile.read(length))
+
+    def _handle(self, method, body):
+        server = self.server
+        slots = server.slots
+        if slots is not None and not slots.acquire(timeout=server.queue_timeout):
+            server.count('rejected')
+            return self._reply(*_error(429, 'Too many concurrent requests'))
+        try:
+            server.count('requests')
+            time.sleep(server.latency.sample())
+            if server.should_fail():
+                server.count('errors')
+                return self._reply(*_error(server.error_status, 'Injected failure'))
+            status, response = self._respond(method, body)
+            if status >= 400:
+                server.count('errors')
+            self._reply(status, response)
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def _respond(self, method, body):
+        server = self.server
+        key = Cassette.key(method, self.path, body)
+
+        if server.mode == 'replay':
+            recorded = server.cassette.lookup(key)
+            if recorded is None:
+                return _error(404, 'Not in the cassette: {}'.format(key))
+            return recorded
+
+        if server.mode == 'record':
+            status, response = server.forward(method, self.path, body)
+            server.cassette.append(key, status, response)
+            return status, response
+
+        path = self.path.rstrip('/')
+        try:
+            payload = json.loads(body or 'null')
+            if method == 'POST' and path == ushiriki_api.CREATE_PATH:
+                return 200, ushiriki_api.response(server.create_evaluation(payload))
+            if path == ushiriki_api.REWARD_PATH or \
+                    path.startswith(ushiriki_api.REWARD_PATH + '/'):
+                # the id in the body, or at the end of the path
+                action_id = payload['actionId'] if method == 'POST' \
+                    else path[len(ushiriki_api.REWARD_PATH) + 1:]
+                reward = server.reward(action_id)
+                if reward is None:
+                    return _error(404, 'Unknown action id {}'.format(action_id))
+                return 200, ushiriki_api.response(reward)
+        except (ValueError, KeyError, TypeError) as e:
+            return _error(400, 'Bad request: {!r}'.format(e))
+        return _error(404, 'Unknown endpoint {}'.format(self.path))
+
+    def _reply(self, status, response):
+        content = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for the Ushiriki challenge API')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--mode', type=str, default='simulate', choices=MODES)
+    parser.add_argument('--cassette', type=str, default=None)
+    parser.add_argument('--upstream', type=str, default=None,
+                        help='base URI of the real service, to record from')
+    parser.add_argument('--latency', type=str, default='none', choices=LATENCIES)
+    parser.add_argument('--latency_ms', type=float, default=0.)
+    parser.add_argument('--latency_spread', type=float, default=.5)
+    parser.add_argument('--error_rate', type=float, default=0.)
+    parser.add_argument('--error_status', type=int, default=503)
+    parser.add_argument('--max_concurrency', type=int, default=None)
+    parser.add_argument('--queue_timeout', type=float, default=0.)
+    parser.add_argument('--noise', type=float, default=0.)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = UshirikiServer(
+        (args.host, args.port), mode=args.mode,
+        latency=LatencyModel(args.latency, args.latency_ms,
+                             args.latency_spread, seed=args.seed),
+        error_rate=args.error_rate, error_status=args.error_status,
+        max_concurrency=args.max_concurrency,
+        queue_timeout=args.queue_timeout, cassette=args.cassette,
+        upstream=args.upstream, noise=args.noise, seed=args.seed,
+        verbose=args.verbose)
+    print('Serving the Ushiriki API ({} mode) at {}'.format(
+        args.mode, server.baseuri))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
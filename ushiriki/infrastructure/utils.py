@@ -1,18 +1,37 @@
 import numpy as np
+import queue
+import threading
 import time
 
+from ushiriki.infrastructure import profiler
+from ushiriki.infrastructure.env_utils import has_policy_steps
+
 ############################################
 ############################################
 
 
-def sample_trajectory(env, policy, max_path_length, render=False, render_mode=('rgb_array')):
+@profiler.timer.timed('episode')
+def sample_trajectory(env, policy, max_path_length, render=False, render_mode=('rgb_array'), batch=None):
+    """
+        Roll out one episode, writing its steps into a RolloutBatch
+
+        With `batch` (from RolloutBatch.empty, with room for max_path_length
+        more steps), the episode is appended to it and the batch returned.
+        Otherwise the episode is returned as a rollout dict, like Path.
+    """
+
+    timer = profiler.timer
+    single = batch is None
+    if single:
+        batch = RolloutBatch.empty(max_path_length)
 
     # initialize env for the beginning of a new rollout
-    ob = env.reset()  # : GETTHIS from HW1
+    with timer.phase('env'):
+        ob = env.reset()  # : GETTHIS from HW1
 
     # init vars
-    obs, acs, rewards, next_obs, terminals, image_obs = [], [], [], [], [], []
-    steps = 0
+    image_obs = []
+    first = step = batch.num_steps
     while True:
 
         # render image of the simulated env
@@ -32,34 +51,34 @@ def sample_trajectory(env, policy, max_path_length, render=False, render_mode=('
                 time.sleep(env.model.opt.timestep)
 
         # use the most recent ob to decide what to do
-        obs.append(ob)
-        ac = policy.get_action(ob)  # : GETTHIS from HW1
-        import pdb
-        pdb.set_trace()
-
-        ac = ac[0]
-        ac = [float(a) for a in ac]
-        acs.append(ac)
+        with timer.phase('policy'):
+            ac = policy.get_action(ob)  # : GETTHIS from HW1
+        ac = [float(a) for a in ac[0]]
 
         # take that action and record results
-        ob, rew, done, _ = env.step(ac)
-
-        # record result of taking that action
-        steps += 1
-        ob = np.array([ob])
-        next_obs.append(ob)
-        rewards.append(rew)
+        with timer.phase('env'):
+            next_ob, rew, done, _ = env.step(ac)
+        next_ob = np.array([next_ob])
 
         # End the rollout if the rollout ended
         # Note that the rollout can end due to done, or due to max_path_length
-        rollout_done = done or steps >= max_path_length  # : GETTHIS from HW1
+        rollout_done = done or step - first + 1 >= max_path_length  # : GETTHIS from HW1
 
-        terminals.append(rollout_done)
+        batch.write_step(step, ob, ac, rew, next_ob, rollout_done)
+        step += 1
+        ob = next_ob
 
         if rollout_done:
             break
 
-    return Path(obs, image_obs, acs, rewards, next_obs, terminals)
+    batch.offsets = np.append(batch.offsets, step)
+    if image_obs:
+        frames = [batch.image_obs] if batch.image_obs is not None else []
+        batch.image_obs = np.concatenate(frames + [np.stack(image_obs, axis=0)])
+
+    timer.count('episodes')
+    timer.count('env_steps', step - first)
+    return batch.trim()[0] if single else batch
 
 
 def sample_trajectories(env, policy, min_timesteps_per_batch, max_path_length, render=False, render_mode=('rgb_array')):
@@ -68,23 +87,163 @@ def sample_trajectories(env, policy, min_timesteps_per_batch, max_path_length, r
     """
         Collect rollouts until we have collected min_timesteps_per_batch steps.
 
-        TODO implement this function
-        Hint1: use sample_trajectory to get each path (i.e. rollout) that goes into paths
-        Hint2: use get_pathlength to count the timesteps collected in each path
+        Every episode is written by sample_trajectory straight into the
+        preallocated arrays of one RolloutBatch.
+    """
+    # the last episode overshoots the target by less than one episode
+    batch = RolloutBatch.empty(min_timesteps_per_batch + max_path_length - 1)
+    while batch.num_steps < min_timesteps_per_batch:
+        sample_trajectory(env, policy, max_path_length,
+                          render=render, render_mode=render_mode, batch=batch)
+    return batch.trim(), batch.num_steps
+
+
+def stream_trajectories(env, policy, min_timesteps_per_batch, max_path_length, max_pending=16):
+    """
+        Generator version of sample_trajectories
+
+        Episodes are collected by a background thread and yielded as soon
+        as each one finishes, so the caller can process them while the
+        next ones are in flight. At most `max_pending` finished episodes
+        wait in the queue. Closing the generator stops the collection.
+    """
+    episodes = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                episodes.put(item, timeout=.1)
+                return
+            except queue.Full:
+                continue
+
+    def collect():
+        try:
+            timesteps_this_batch = 0
+            while timesteps_this_batch < min_timesteps_per_batch and not stop.is_set():
+                path = sample_trajectory(env, policy, max_path_length)
+                put(path)
+                timesteps_this_batch += get_pathlength(path)
+        except Exception as e:
+            put(e)
+        finally:
+            put(end)
+
+    collector = threading.Thread(target=collect, daemon=True)
+    collector.start()
+    try:
+        while True:
+            item = episodes.get()
+            if item is end:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        collector.join()
+
+
+def sample_trajectories_vec(vec_env, policy, min_timesteps_per_batch, max_path_length):
+    """
+        Collect rollouts from a VectorEnv until we have collected
+        min_timesteps_per_batch steps.
+
+        All envs of the VectorEnv run one episode each per round, and the
+        policy is queried once per timestep on the stacked [N, ob_dim]
+        observations of that round.
     """
     timesteps_this_batch = 0
-    paths = []
+    batches = []
+    n_envs = vec_env.num_envs
     while timesteps_this_batch < min_timesteps_per_batch:
 
-        path = sample_trajectory(env,
-                                 policy,
-                                 max_path_length,
-                                 render=render,
-                                 render_mode=render_mode)
-        paths.append(path)
-        timesteps_this_batch += get_pathlength(path)
+        # only start as many episodes as are still needed
+        n_needed = -(-(min_timesteps_per_batch - timesteps_this_batch)
+                     // max_path_length)
+        active = np.arange(n_envs) < n_needed
+        started = active.copy()
+
+        ob = vec_env.reset()
+        obs, acs, rewards, next_obs, terminals = [], [], [], [], []
+        steps = 0
+        while active.any():
+            obs.append(ob)
+            ac = policy.get_action(ob)
+            acs.append(ac)
+
+            ob, rew, done, _ = vec_env.step(ac, active)
+            steps += 1
+            next_obs.append(ob)
+            rewards.append(rew)
+
+            rollout_done = done | (steps >= max_path_length)
+            terminals.append(rollout_done)
+            active = active & ~rollout_done
+
+        # [T, N, ...] arrays, one column per env
+        obs, acs, rewards, next_obs, terminals = map(
+            np.stack, (obs, acs, rewards, next_obs, terminals))
+
+        # env-major order of the valid steps, one episode per started env
+        started = np.flatnonzero(started)
+        lengths = np.argmax(terminals[:, started], axis=0) + 1
+        valid = np.arange(len(terminals))[:, None] < lengths
+        batches.append(RolloutBatch(
+            *(np.swapaxes(field[:, started], 0, 1)[valid.T]
+              for field in (obs, acs, rewards, next_obs, terminals)),
+            offsets=np.cumsum(np.append(0, lengths))))
+        timesteps_this_batch += lengths.sum()
+
+    return RolloutBatch.concatenate(batches), timesteps_this_batch
+
+
+def sample_trajectories_open_loop(env, policy, min_timesteps_per_batch, max_path_length):
+    """
+        Collect whole episodes without stepping the env.
+
+        The state sequence is years 1..T whatever the actions, so the
+        actions of every year of every episode come from a single
+        get_action call on the precomputed [N*T, 1] observations, and the
+        resulting policies are evaluated by one evaluatePolicy call.
+
+        Per-year rewards come from the env's evaluatePolicySteps when it
+        has one (local simulator). Otherwise only the return of each policy
+        is known, and it is credited to its final step: the reward-to-go of
+        earlier steps is then wrong, and so are discounted returns, so the
+        trainer only allows undiscounted trajectory-return PG in that case.
+    """
+    ep_len = env.policyDimension
+    assert max_path_length >= ep_len, \
+        'Open-loop episodes always cover the {} years'.format(ep_len)
+
+    n_episodes = -(-min_timesteps_per_batch // ep_len)
+    years = np.arange(1, ep_len + 1, dtype=np.float32)
+
+    obs = np.tile(years, n_episodes)[:, None]
+    acs = np.asarray(policy.get_action(obs)).reshape(n_episodes, ep_len, -1)
+
+    policies = [{str(year): [float(a) for a in ac]
+                 for year, ac in zip(range(1, ep_len + 1), episode_acs)}
+                for episode_acs in acs]
+
+    if has_policy_steps(env):
+        rewards = np.asarray(env.evaluatePolicySteps(policies))
+    else:
+        rewards = np.zeros((n_episodes, ep_len), dtype=np.float32)
+        rewards[:, -1] = env.evaluatePolicy(policies)
+
+    terminals = np.zeros(ep_len, dtype=bool)
+    terminals[-1] = True
 
-    return paths, timesteps_this_batch
+    batch = RolloutBatch(obs, acs.reshape(n_episodes * ep_len, -1),
+                         rewards.reshape(-1), obs + 1,
+                         np.tile(terminals, n_episodes),
+                         offsets=np.arange(n_episodes + 1) * ep_len)
+
+    return batch, n_episodes * ep_len
 
 
 def sample_n_trajectories(env, policy, ntraj, max_path_length, render=False, render_mode=('rgb_array')):
@@ -123,12 +282,157 @@ def Path(obs, image_obs, acs, rewards, next_obs, terminals):
             "terminal": np.array(terminals, dtype=np.float32)}
 
 
+class RolloutBatch(object):
+    """
+        Rollouts stored column-wise
+
+        Each field is one float32 array over the steps of all episodes,
+        with episode i spanning steps offsets[i]:offsets[i+1]. Frames are
+        only kept for rendered rollouts.
+
+        Indexing or iterating gives rollout dicts, like the ones of Path,
+        made of views of the fields.
+    """
+
+    FIELDS = ('observation', 'action', 'reward', 'next_observation', 'terminal')
+
+    __slots__ = FIELDS + ('offsets', 'image_obs', 'capacity')
+
+    def __init__(self, observation, action, reward, next_observation,
+                 terminal, offsets, image_obs=None):
+        self.observation = np.asarray(observation, dtype=np.float32)
+        self.action = np.asarray(action, dtype=np.float32)
+        self.reward = np.asarray(reward, dtype=np.float32)
+        self.next_observation = np.asarray(next_observation, dtype=np.float32)
+        self.terminal = np.asarray(terminal, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.image_obs = image_obs
+        self.capacity = None
+
+    @classmethod
+    def empty(cls, capacity):
+        """
+            Batch with room for `capacity` steps, to be filled in place
+            with `write_step` and then cut down with `trim`
+
+            The fields are allocated by the first step, once the shapes of
+            the observations and actions are known.
+        """
+        batch = cls(*([np.zeros(0)] * len(cls.FIELDS)), offsets=[0])
+        batch.capacity = capacity
+        return batch
+
+    def write_step(self, step, ob, ac, rew, next_ob, terminal):
+        """
+            Write one transition at row `step`
+        """
+        if self.capacity is not None and len(self.observation) != self.capacity:
+            ob_shape, ac_shape = np.shape(ob), np.shape(ac)
+            self.observation = np.zeros((self.capacity,) + ob_shape, dtype=np.float32)
+            self.action = np.zeros((self.capacity,) + ac_shape, dtype=np.float32)
+            self.reward = np.zeros(self.capacity, dtype=np.float32)
+            self.next_observation = np.zeros((self.capacity,) + ob_shape, dtype=np.float32)
+            self.terminal = np.zeros(self.capacity, dtype=np.float32)
+        self.observation[step] = ob
+        self.action[step] = ac
+        self.reward[step] = rew
+        self.next_observation[step] = next_ob
+        self.terminal[step] = terminal
+
+    def trim(self):
+        """
+            Drop the unused preallocated steps
+        """
+        n_steps = self.num_steps
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name)[:n_steps])
+        self.capacity = None
+        return self
+
+    @classmethod
+    def from_paths(cls, paths):
+        """
+            Batch of a list of rollout dicts
+        """
+        if isinstance(paths, cls):
+            return paths
+        if not len(paths):
+            return cls(*([np.zeros(0)] * len(cls.FIELDS)), offsets=[0])
+
+        lengths = [get_pathlength(path) for path in paths]
+        image_obs = [path['image_obs'] for path in paths if len(path['image_obs'])]
+        return cls(*(np.concatenate([path[name] for path in paths])
+                     for name in cls.FIELDS),
+                   offsets=np.cumsum([0] + lengths),
+                   image_obs=np.concatenate(image_obs) if image_obs else None)
+
+    @classmethod
+    def concatenate(cls, batches):
+        batches = [batch for batch in batches if len(batch)]
+        if len(batches) == 1:
+            return batches[0]
+        if not batches:
+            return cls.from_paths([])
+
+        offsets = [batches[0].offsets]
+        for batch in batches[1:]:
+            offsets.append(batch.offsets[1:] + offsets[-1][-1])
+        image_obs = [batch.image_obs for batch in batches
+                     if batch.image_obs is not None]
+        return cls(*(np.concatenate([getattr(batch, name) for batch in batches])
+                     for name in cls.FIELDS),
+                   offsets=np.concatenate(offsets),
+                   image_obs=np.concatenate(image_obs) if image_obs else None)
+
+    def __len__(self):
+        """
+            Number of episodes
+        """
+        return len(self.offsets) - 1
+
+    @property
+    def num_steps(self):
+        return int(self.offsets[-1])
+
+    def episode_lengths(self):
+        return np.diff(self.offsets)
+
+    def episode_returns(self):
+        if not len(self):
+            return np.zeros(0, dtype=np.float32)
+        return np.add.reduceat(self.reward, self.offsets[:-1])
+
+    def rewards_list(self):
+        """
+            Per-episode reward arrays, as views
+        """
+        return np.split(self.reward, self.offsets[1:-1])
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        rows = slice(self.offsets[i], self.offsets[i + 1])
+        path = {name: getattr(self, name)[rows] for name in self.FIELDS}
+        path['image_obs'] = (self.image_obs[rows] if self.image_obs is not None
+                             else np.array([], dtype=np.uint8))
+        return path
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
 def convert_listofrollouts(paths):
     """
-        Take a list of rollout dictionaries
+        Take a list of rollout dictionaries (or a RolloutBatch)
         and return separate arrays,
         where each array is a concatenation of that array from across the rollouts
     """
+    if isinstance(paths, RolloutBatch):
+        return (paths.observation, paths.action, paths.next_observation,
+                paths.terminal, paths.reward, paths.rewards_list())
     observations = np.concatenate([path["observation"] for path in paths])
     actions = np.concatenate([path["action"] for path in paths])
     next_observations = np.concatenate(
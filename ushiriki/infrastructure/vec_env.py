@@ -0,0 +1,74 @@
+"""
+    Steps several Ushiriki environments in lockstep
+"""
+import concurrent.futures
+
+import numpy as np
+
+
+class VectorEnv(object):
+    """
+        Holds N environments and steps them together
+
+        Observations, rewards and dones come back stacked along a leading
+        axis of size N, so the policy can act on all environments with a
+        single `get_action` call per timestep. The env calls themselves are
+        issued concurrently from a thread pool, since each one is mostly
+        spent waiting on the network.
+    """
+
+    def __init__(self, envs, n_threads=None):
+        self.envs = list(envs)
+        self.num_envs = len(self.envs)
+
+        env = self.envs[0]
+        self.policyDimension = env.policyDimension
+        self.actionDimension = env.actionDimension
+        self.observation_dim = env.observation_dim
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=n_threads or self.num_envs)
+
+    def _map(self, fn, indices):
+        return list(self._executor.map(fn, indices))
+
+    def reset(self):
+        """
+            Reset every env
+
+            returns the initial observations, shape [N, ob_dim]
+        """
+        obs = self._map(lambda i: self.envs[i].reset(), range(self.num_envs))
+        return np.stack([np.reshape(ob, -1) for ob in obs]).astype(np.float32)
+
+    def step(self, acs, active=None):
+        """
+            Step the active envs with their row of `acs`, shape [N, ac_dim]
+
+            Inactive envs are left untouched and report a zero observation,
+            a zero reward and done=True.
+
+            returns obs [N, ob_dim], rewards [N], dones [N], infos (list of N)
+        """
+        if active is None:
+            active = np.ones(self.num_envs, dtype=bool)
+
+        obs = np.zeros((self.num_envs, self.observation_dim), dtype=np.float32)
+        rews = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.ones(self.num_envs, dtype=bool)
+        infos = [{} for _ in range(self.num_envs)]
+
+        def step_env(i):
+            return self.envs[i].step([float(a) for a in acs[i]])
+
+        indices = np.flatnonzero(active)
+        for i, (ob, rew, done, info) in zip(indices, self._map(step_env, indices)):
+            obs[i] = np.reshape(ob, -1)
+            rews[i] = rew
+            dones[i] = done
+            infos[i] = info
+
+        return obs, rews, dones, infos
+
+    def close(self):
+        self._executor.shutdown()
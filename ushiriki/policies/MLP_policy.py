@@ -19,6 +19,10 @@ class MLPPolicy(BasePolicy):
                  discrete=False,  # unused for now
                  nn_baseline=False,  # unused for now
                  gae=False,
+                 joint_baseline_step=False,
+                 memoize_actions=False,
+                 max_memoized_obs=1024,
+                 seed=None,
                  **kwargs):
         super().__init__(**kwargs)
 
@@ -34,6 +38,20 @@ class MLPPolicy(BasePolicy):
         self.nn_baseline = nn_baseline
         self.gae = gae
 
+        # the policy and baseline Adam steps in a single sess.run
+        self.joint_baseline_step = joint_baseline_step
+
+        # bumped whenever the weights change, invalidates memoized actions
+        self.policy_version = 0
+        self.memoize_actions = memoize_actions and not discrete
+        self.max_memoized_obs = max_memoized_obs
+        self._dist_table = {}
+        self._dist_table_version = 0
+        self.memo_hits = 0
+        self.memo_misses = 0
+        # samples memoized actions, seeded like NumpyMLPPolicy.rng
+        self.rng = np.random.RandomState(seed)
+
         # build TF graph
         with tf.variable_scope(policy_scope, reuse=tf.AUTO_REUSE):
             self.build_graph()
@@ -72,14 +90,20 @@ class MLPPolicy(BasePolicy):
             self.parameters = (mean, logstd)
 
     def build_action_sampling(self):
+        # inference outputs are built once here, get_action only runs them
         if self.discrete:
             logits_na = self.parameters
             self.sample_ac = tf.squeeze(
                 tf.multinomial(logits_na, num_samples=1), axis=1)
+            self.action_out = self.sample_ac
+            self.mean_action_out = tf.argmax(logits_na, axis=1)
         else:
             mean, logstd = self.parameters
             self.sample_ac = mean + \
                 tf.exp(logstd) * tf.random_normal(tf.shape(mean), 0, 1)
+            self.action_out = tf.exp(self.sample_ac)
+            self.mean_action_out = tf.exp(mean)
+            self.std_out = tf.exp(logstd)
 
     def define_train_op(self):
         raise NotImplementedError
@@ -107,6 +131,14 @@ class MLPPolicy(BasePolicy):
 
     def restore(self, filepath):
         self.policy_saver.restore(self.sess, filepath)
+        self.policy_version += 1
+
+    def get_weights(self):
+        """
+            Current values of the policy variables, keyed by variable name
+        """
+        return dict(zip([v.name for v in self.policy_vars],
+                        self.sess.run(self.policy_vars)))
 
     ##################################
 
@@ -114,18 +146,64 @@ class MLPPolicy(BasePolicy):
     def update(self, observations, actions):
         raise NotImplementedError
 
-    def get_action(self, obs):
+    def get_action(self, obs, deterministic=False):
 
         if len(obs.shape) > 1:
             observation = obs
         else:
             observation = obs[None]
 
-        action = self.sess.run(tf.exp(self.sample_ac), feed_dict={
+        if self.memoize_actions:
+            return self._get_memoized_action(observation, deterministic)
+
+        # the mean action when deterministic, a sampled one otherwise
+        action_out = self.mean_action_out if deterministic else self.action_out
+        action = self.sess.run(action_out, feed_dict={
                                self.observations_pl: observation})
 
         return action
 
+    def _get_memoized_action(self, observation, deterministic):
+        """
+            Look up the (mean, logstd) of each observation in a table
+            filled for the current policy version, running the network
+            only for observations not seen yet, and sample with NumPy
+        """
+        if self._dist_table_version != self.policy_version:
+            self._dist_table = {}
+            self._dist_table_version = self.policy_version
+
+        observation = np.asarray(observation, dtype=np.float32)
+        keys = [row.tobytes() for row in observation]
+        unseen = [i for i, key in enumerate(keys) if key not in self._dist_table]
+
+        self.memo_misses += len(unseen)
+        self.memo_hits += len(keys) - len(unseen)
+
+        fallback = {}
+        if unseen:
+            mean, logstd = self.sess.run(self.parameters, feed_dict={
+                self.observations_pl: observation[unseen]})
+            for i, row_mean in zip(unseen, mean):
+                if len(self._dist_table) < self.max_memoized_obs:
+                    self._dist_table[keys[i]] = (row_mean, logstd)
+                else:
+                    fallback[keys[i]] = (row_mean, logstd)
+
+        dists = [self._dist_table.get(key) or fallback[key] for key in keys]
+        mean = np.stack([dist[0] for dist in dists])
+        if deterministic:
+            return np.exp(mean)
+
+        std = np.exp(np.stack([dist[1] for dist in dists]))
+        return np.exp(mean + std * self.rng.standard_normal(mean.shape))
+
+    def memo_stats(self):
+        return {'hits': self.memo_hits,
+                'misses': self.memo_misses,
+                'size': len(self._dist_table),
+                'version': self.policy_version}
+
 
 class MLPPolicyPG(MLPPolicy):
 
@@ -173,6 +251,13 @@ class MLPPolicyPG(MLPPolicy):
 
     #########################
 
+    def run_logprob(self, obs, acs_na):
+        """
+            Log-probability of the actions under the current policy
+        """
+        return self.sess.run(self.logprob_n, feed_dict={
+            self.observations_pl: obs, self.actions_pl: acs_na})
+
     def run_baseline_prediction(self, obs):
 
         if obs.ndim == 1:
@@ -186,16 +271,73 @@ class MLPPolicyPG(MLPPolicy):
     def update(self, observations, acs_na, adv_n=None, acs_labels_na=None, qvals=None):
         assert self.training, 'Policy must be created with training=True in order to perform training updates...'
 
-        _, loss = self.sess.run([self.train_op, self.loss], feed_dict={
-                                self.observations_pl: observations, self.actions_pl: acs_na, self.adv_n: adv_n})
+        feed_dict = {self.observations_pl: observations,
+                     self.actions_pl: acs_na, self.adv_n: adv_n}
+        fetches = [self.train_op, self.loss]
 
         if self.nn_baseline:
-
             if not self.gae:
                 targets_n = (qvals - np.mean(qvals))/(np.std(qvals)+1e-8)
             else:
                 targets_n = qvals.copy()
-            _, val_loss = self.sess.run([self.baseline_update_op, self.baseline_loss], feed_dict={
-                                        self.observations_pl: observations, self.targets_n: targets_n})
-            return loss, val_loss
+            baseline_fetches = [self.baseline_update_op, self.baseline_loss]
+
+            # both steps at once: they update disjoint variables
+            if self.joint_baseline_step:
+                feed_dict[self.targets_n] = targets_n
+                fetches += baseline_fetches
+
+        results = self.sess.run(fetches, feed_dict=feed_dict)
+        self.policy_version += 1
+        loss = results[1]
+
+        if not self.nn_baseline:
+            return loss
+        if self.joint_baseline_step:
+            return loss, results[3]
+        _, val_loss = self.sess.run(baseline_fetches, feed_dict={
+                                    self.observations_pl: observations, self.targets_n: targets_n})
+        return loss, val_loss
+
+
+class MLPPolicySL(MLPPolicy):
+    """
+        Policy trained by supervised regression onto action labels, used
+        by BCAgent. Continuous actions are regressed in log space, where
+        the network's mean lives (get_action returns its exp).
+    """
+
+    def define_placeholders(self):
+        # placeholder for observations
+        self.observations_pl = tf.placeholder(
+            shape=[None, self.ob_dim], name="ob", dtype=tf.float32)
+
+        # placeholder for the action labels
+        if self.training:
+            if self.discrete:
+                self.acs_labels_na = tf.placeholder(
+                    shape=[None], name="labels", dtype=tf.int32)
+            else:
+                self.acs_labels_na = tf.placeholder(
+                    shape=[None, self.ac_dim], name="labels", dtype=tf.float32)
+
+    def define_train_op(self):
+        if self.discrete:
+            self.loss = tf.reduce_mean(
+                tf.nn.sparse_softmax_cross_entropy_with_logits(
+                    labels=self.acs_labels_na, logits=self.parameters))
+        else:
+            mean, _ = self.parameters
+            log_labels = tf.log(tf.maximum(self.acs_labels_na, 1e-6))
+            self.loss = tf.losses.mean_squared_error(log_labels, mean)
+
+        self.train_op = tf.train.AdamOptimizer(
+            self.learning_rate).minimize(self.loss)
+
+    def update(self, observations, actions):
+        assert self.training, 'Policy must be created with training=True in order to perform training updates...'
+
+        _, loss = self.sess.run([self.train_op, self.loss], feed_dict={
+            self.observations_pl: observations, self.acs_labels_na: actions})
+        self.policy_version += 1
         return loss
@@ -0,0 +1,148 @@
+import re
+
+import numpy as np
+
+from .base_policy import BasePolicy
+
+
+def _as_weight(value):
+    return np.ascontiguousarray(value, dtype=np.float32)
+
+
+class NumpyMLPPolicy(BasePolicy):
+    """
+        NumPy forward pass of a continuous MLPPolicy
+
+        Built from the values returned by `MLPPolicy.get_weights`, so it can
+        act without a TF session (e.g. inside rollout worker processes).
+        It mirrors `build_mlp`: every hidden layer reads the observation
+        directly, so only the last hidden layer feeds the output layer.
+    """
+
+    _layer_re = re.compile(r'continuous_logits/dense(?:_(\d+))?/(kernel|bias):0$')
+
+    def __init__(self, weights, seed=None, source=None, **kwargs):
+        super().__init__(**kwargs)
+        self.rng = np.random.RandomState(seed)
+        self.source = source
+        self.version = getattr(source, 'policy_version', None)
+        self.set_weights(weights)
+
+    @classmethod
+    def from_policy(cls, policy, seed=None):
+        """
+            Copy of an MLPPolicy, which `refresh` keeps in sync
+        """
+        return cls(policy.get_weights(), seed=seed, source=policy)
+
+    def refresh(self):
+        """
+            Pull the current weights of the source policy from its session,
+            unless its version shows they haven't changed
+        """
+        version = getattr(self.source, 'policy_version', None)
+        if version is not None and version == self.version:
+            return
+        self.set_weights(self.source.get_weights())
+        self.version = version
+
+    def set_weights(self, weights):
+        """
+            Load the policy variables, keyed by TF variable name
+        """
+        layers = {}
+        for name, value in weights.items():
+            match = self._layer_re.search(name)
+            if match:
+                index = int(match.group(1) or 0)
+                layers.setdefault(index, {})[match.group(2)] = _as_weight(value)
+            elif name.endswith('logstd:0'):
+                self.logstd = _as_weight(value)
+
+        layers = [layers[i] for i in sorted(layers)]
+        self.out_W, self.out_b = layers[-1]['kernel'], layers[-1]['bias']
+        self.hidden_W, self.hidden_b = (
+            (layers[-2]['kernel'], layers[-2]['bias']) if len(layers) > 1
+            else (None, None))
+        self.std = np.exp(self.logstd)
+
+    def _mean(self, observation):
+        activations = observation
+        if self.hidden_W is not None:
+            activations = np.tanh(observation @ self.hidden_W + self.hidden_b)
+        return activations @ self.out_W + self.out_b
+
+    def log_prob(self, obs, acs):
+        """
+            Log-density of the actions as recorded, like the `logprob_n`
+            the MLPPolicy is trained on
+        """
+        mean = self._mean(np.asarray(obs, dtype=np.float32))
+        z = (np.asarray(acs, dtype=np.float32) - mean) / self.std
+        return np.sum(-0.5 * np.square(z) - self.logstd
+                      - 0.5 * np.log(2 * np.pi), axis=-1)
+
+    def get_action(self, obs, deterministic=False):
+
+        if len(obs.shape) > 1:
+            observation = obs
+        else:
+            observation = obs[None]
+
+        mean = self._mean(np.asarray(observation, dtype=np.float32))
+        if deterministic:
+            return np.exp(mean)
+
+        sample_ac = mean + self.std * \
+            self.rng.standard_normal(mean.shape).astype(np.float32)
+        return np.exp(sample_ac)
+
+
+class NumpyGaussianPolicy(BasePolicy):
+    """
+        NumPy forward pass of a Loaded_Gaussian_Policy: observation
+        normalization, the hidden FeedforwardNet and the `out` layer
+    """
+
+    def __init__(self, policy_params, nonlin_type, **kwargs):
+        super().__init__(**kwargs)
+        self.nonlin_type = nonlin_type
+
+        standardizer = policy_params['obsnorm']['Standardizer']
+        self.obsnorm_mean = _as_weight(standardizer['mean_1_D'])
+        obsnorm_meansq = _as_weight(standardizer['meansq_1_D'])
+        self.obsnorm_stdev = np.sqrt(np.maximum(
+            0, obsnorm_meansq - np.square(self.obsnorm_mean))) + 1e-6
+
+        layer_params = policy_params['hidden']['FeedforwardNet']
+        self.hidden = [self.read_layer(layer_params[layer_name])
+                       for layer_name in sorted(layer_params.keys())]
+        self.out_W, self.out_b = self.read_layer(policy_params['out'])
+
+    @classmethod
+    def from_policy(cls, policy):
+        return cls(policy.policy_params, policy.nonlin_type)
+
+    def read_layer(self, l):
+        return _as_weight(l['AffineLayer']['W']), _as_weight(l['AffineLayer']['b'])
+
+    def apply_nonlin(self, x):
+        if self.nonlin_type == 'lrelu':
+            leak = .01
+            return 0.5 * (1 + leak) * x + 0.5 * (1 - leak) * np.abs(x)
+        elif self.nonlin_type == 'tanh':
+            return np.tanh(x)
+        else:
+            raise NotImplementedError(self.nonlin_type)
+
+    def get_action(self, obs):
+        if len(obs.shape) > 1:
+            observation = obs
+        else:
+            observation = obs[None, :]
+
+        activations = (np.asarray(observation, dtype=np.float32)
+                       - self.obsnorm_mean) / self.obsnorm_stdev
+        for W, b in self.hidden:
+            activations = self.apply_nonlin(activations @ W + b)
+        return activations @ self.out_W + self.out_b
@@ -0,0 +1,76 @@
+"""
+    Benchmark of the vectorized GAE against the original per-step loop
+
+    $ python ushiriki/scripts/bench_gae.py --steps 100000 1000000
+"""
+import time
+
+import numpy as np
+
+from ushiriki.infrastructure import returns
+
+
+def gae_loop(rewards, v_baseline, terminals, gamma, lamda):
+    """
+        The per-step loop PGAgent.use_gae used before vectorization
+    """
+    rew_len = rewards.size
+    adv = np.zeros((rew_len,))
+
+    for t in reversed(range(rew_len)):
+        if terminals[t]:
+            delta = rewards[t] - v_baseline[t]
+            adv[t] = delta
+        else:
+            delta = rewards[t] + (1 - terminals[t]) * \
+                gamma * v_baseline[t+1] - v_baseline[t]
+
+            adv[t] = delta + gamma * lamda * adv[t+1]
+    return adv
+
+
+def make_batch(n_steps, ep_len, seed=0):
+    rng = np.random.RandomState(seed)
+    rewards = rng.standard_normal(n_steps).astype(np.float32)
+    v_baseline = rng.standard_normal(n_steps).astype(np.float32)
+    terminals = np.zeros(n_steps, dtype=np.float32)
+    terminals[ep_len - 1::ep_len] = 1
+    terminals[-1] = 1
+    return rewards, v_baseline, terminals
+
+
+def timeit(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', type=int, nargs='+',
+                        default=[100000, 1000000])
+    parser.add_argument('--ep_len', type=int, default=5)
+    parser.add_argument('--discount', type=float, default=.99)
+    parser.add_argument('--lambda', type=float, default=.95)
+    args = parser.parse_args()
+
+    gamma, lamda = args.discount, getattr(args, 'lambda')
+
+    print('{:>10} {:>12} {:>12} {:>8}'.format(
+        'steps', 'loop (s)', 'vector (s)', 'speedup'))
+    for n_steps in args.steps:
+        batch = make_batch(n_steps, args.ep_len)
+        loop_time, expected = timeit(gae_loop, *batch, gamma, lamda, repeat=1)
+        vec_time, adv = timeit(returns.gae, *batch, gamma, lamda)
+
+        np.testing.assert_allclose(adv, expected, rtol=1e-4, atol=1e-4)
+        print('{:>10} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(
+            n_steps, loop_time, vec_time, loop_time / vec_time))
+
+
+if __name__ == "__main__":
+    main()
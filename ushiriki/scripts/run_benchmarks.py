@@ -0,0 +1,257 @@
+"""
+    Micro-benchmarks of the learner and data-path hot spots
+
+    Every benchmark runs at each of the batch sizes of --steps and reports
+    its best time per call, its throughput in steps per second and the
+    peak Python/NumPy heap allocated during one call (tracemalloc; memory
+    held by TensorFlow itself is not seen). Results are written as JSON.
+
+    Save a baseline on a known-good tree, then compare against it:
+        $ python ushiriki/scripts/run_benchmarks.py --save_baseline bench_baseline.json
+        $ python ushiriki/scripts/run_benchmarks.py --baseline bench_baseline.json
+
+    The exit status is 1 if any benchmark got slower than its baseline by
+    more than --tolerance, or allocates more by more than --memory_tolerance.
+"""
+import json
+import platform
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+import tensorflow as tf
+
+from ushiriki.agents.pg_agent import PGAgent
+from ushiriki.infrastructure.replay_buffer import ReplayBuffer
+from ushiriki.infrastructure.utils import Path, convert_listofrollouts
+
+# shapes of the Ushiriki env: the year as observation, two intervention rates
+OB_DIM = 1
+AC_DIM = 2
+
+# peak heap differences below this are noise, whatever the relative change
+MEMORY_SLACK = 64 * 1024
+
+
+def make_paths(n_steps, ep_len, seed=0):
+    """
+        Rollout dicts covering n_steps, in episodes of ep_len steps
+    """
+    rng = np.random.RandomState(seed)
+    paths = []
+    for start in range(0, n_steps, ep_len):
+        length = min(ep_len, n_steps - start)
+        obs = np.arange(1, length + 1, dtype=np.float32)[:, None]
+        terminals = np.zeros(length)
+        terminals[-1] = 1
+        paths.append(Path(obs, [], rng.uniform(size=(length, AC_DIM)),
+                          rng.standard_normal(length), obs + 1, terminals))
+    return paths
+
+
+def make_agent(sess, gamma, lamda):
+    agent_params = {
+        'ac_dim': AC_DIM, 'ob_dim': OB_DIM, 'n_layers': 2, 'size': 64,
+        'discrete': False, 'learning_rate': 5e-3, 'gamma': gamma,
+        'lambda': lamda, 'standardize_advantages': True,
+        'reward_to_go': True, 'nn_baseline': True, 'gae': False,
+    }
+    agent = PGAgent(sess, None, agent_params)
+    sess.run(tf.global_variables_initializer())
+    return agent
+
+
+#####################################################
+#####################################################
+
+# each benchmark takes (agent, paths) and returns the function to time;
+# the per-rollout helpers get all the steps as one long rollout
+
+def bench_discounted_return(agent, paths):
+    rewards = np.concatenate([path['reward'] for path in paths])
+    return lambda: agent._discounted_return(rewards)
+
+
+def bench_discounted_cumsum(agent, paths):
+    rewards = np.concatenate([path['reward'] for path in paths])
+    return lambda: agent._discounted_cumsum(rewards)
+
+
+def bench_use_gae(agent, paths):
+    obs, _, _, terminals, rewards, _ = convert_listofrollouts(paths)
+    return lambda: agent.use_gae(rewards, obs, terminals)
+
+
+def bench_estimate_advantage(agent, paths):
+    obs, _, _, _, _, rews_list = convert_listofrollouts(paths)
+    q_values = agent.calculate_q_vals(rews_list)
+    return lambda: agent.estimate_advantage(obs, q_values)
+
+
+def bench_add_rollouts(agent, paths):
+    n_steps = sum(len(path['reward']) for path in paths)
+
+    def add_rollouts():
+        ReplayBuffer(n_steps).add_rollouts(paths)
+    return add_rollouts
+
+
+def _filled_buffer(paths):
+    buffer = ReplayBuffer(sum(len(path['reward']) for path in paths))
+    buffer.add_rollouts(paths)
+    return buffer
+
+
+def bench_sample_random_data(agent, paths):
+    buffer = _filled_buffer(paths)
+    return lambda: buffer.sample_random_data(len(buffer))
+
+
+def bench_sample_recent_data(agent, paths):
+    buffer = _filled_buffer(paths)
+    return lambda: buffer.sample_recent_data(len(buffer), concat_rew=False)
+
+
+def bench_convert_listofrollouts(agent, paths):
+    return lambda: convert_listofrollouts(paths)
+
+
+def bench_get_action(agent, paths):
+    obs = convert_listofrollouts(paths)[0]
+    return lambda: agent.actor.get_action(obs)
+
+
+def bench_update(agent, paths):
+    obs, acs, _, _, _, rews_list = convert_listofrollouts(paths)
+    q_values = agent.calculate_q_vals(rews_list)
+    adv_n = agent.estimate_advantage(obs, q_values)
+    return lambda: agent.actor.update(obs, acs, qvals=q_values, adv_n=adv_n)
+
+
+BENCHMARKS = [
+    ('pg/discounted_return', bench_discounted_return),
+    ('pg/discounted_cumsum', bench_discounted_cumsum),
+    ('pg/use_gae', bench_use_gae),
+    ('pg/estimate_advantage', bench_estimate_advantage),
+    ('buffer/add_rollouts', bench_add_rollouts),
+    ('buffer/sample_random_data', bench_sample_random_data),
+    ('buffer/sample_recent_data', bench_sample_recent_data),
+    ('utils/convert_listofrollouts', bench_convert_listofrollouts),
+    ('policy/get_action', bench_get_action),
+    ('policy/update', bench_update),
+]
+
+
+#####################################################
+#####################################################
+
+def measure(fn, repeat):
+    """
+        Best time per call over `repeat` rounds, each long enough to be
+        timed reliably, and the peak heap allocated by one call
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat, number)) / number
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run_benchmarks(steps, ep_len, repeat, only=None, gamma=.99, lamda=.95):
+    results = []
+    with tf.Graph().as_default(), tf.Session() as sess:
+        agent = make_agent(sess, gamma, lamda)
+        for n_steps in steps:
+            paths = make_paths(n_steps, ep_len)
+            for name, bench in BENCHMARKS:
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                seconds, peak = measure(bench(agent, paths), repeat)
+                results.append({'name': name,
+                                'steps': n_steps,
+                                'seconds': seconds,
+                                'steps_per_sec': n_steps / seconds,
+                                'peak_bytes': peak})
+                print('{:<30} {:>8} {:>14.4g} {:>14.4g} {:>10.2f}'.format(
+                    name, n_steps, seconds, n_steps / seconds, peak / 2**20))
+                sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    """
+        Benchmarks slower or more memory hungry than their baseline
+
+        returns a list of (name, steps, metric, baseline value, new value)
+    """
+    expected = {(r['name'], r['steps']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        base = expected.get((result['name'], result['steps']))
+        if base is None:
+            continue
+        for metric, limit, slack in (('seconds', tolerance, 0),
+                                     ('peak_bytes', memory_tolerance, MEMORY_SLACK)):
+            if result[metric] > max(base[metric] * (1 + limit), base[metric] + slack):
+                regressions.append((result['name'], result['steps'], metric,
+                                    base[metric], result[metric]))
+    return regressions
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Micro-benchmarks of the learner and data path')
+    parser.add_argument('--steps', type=int, nargs='+',
+                        default=[100, 1000, 10000, 100000, 1000000])
+    parser.add_argument('--ep_len', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', type=str, nargs='+',
+                        help='name prefixes of the benchmarks to run, e.g. buffer/')
+    parser.add_argument('--output', type=str, default='benchmarks.json')
+    parser.add_argument('--baseline', type=str,
+                        help='results file to compare against')
+    parser.add_argument('--save_baseline', type=str,
+                        help='also write the results to this baseline file')
+    parser.add_argument('--tolerance', type=float, default=.25,
+                        help='allowed relative slowdown')
+    parser.add_argument('--memory_tolerance', type=float, default=.1,
+                        help='allowed relative increase of the peak heap')
+    args = parser.parse_args()
+
+    print('{:<30} {:>8} {:>14} {:>14} {:>10}'.format(
+        'benchmark', 'steps', 'seconds', 'steps/sec', 'peak (MB)'))
+    results = run_benchmarks(args.steps, args.ep_len, args.repeat, args.only)
+
+    report = {'machine': {'python': platform.python_version(),
+                          'numpy': np.__version__,
+                          'tensorflow': tf.__version__,
+                          'platform': platform.platform()},
+              'ep_len': args.ep_len,
+              'results': results}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance,
+                              args.memory_tolerance)
+        for name, n_steps, metric, before, after in regressions:
+            print('REGRESSION {} at {} steps: {} {:.4g} -> {:.4g} ({:+.0%})'.format(
+                name, n_steps, metric, before, after, after / before - 1))
+        if regressions:
+            sys.exit(1)
+        print('No regression against {}'.format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
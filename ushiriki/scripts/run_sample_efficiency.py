@@ -0,0 +1,185 @@
+"""
+    Sample efficiency of agent configurations: the env calls needed to
+    reach given returns
+
+    Every configuration trains, for each seed, against the local simulator
+    (deterministic, no noise) with logging off. After each iteration the
+    mean action of the policy is evaluated on a separate, uncounted env,
+    and the first time that return reaches a threshold, the env calls,
+    wall time and CPU time spent so far are recorded. A run stops once it
+    reached every threshold, or after --n_iter iterations.
+
+    $ python ushiriki/scripts/run_sample_efficiency.py --thresholds 25 35 --seeds 1 2 3
+
+    Arguments not known here are passed on to run_ushiriki_psearch.py for
+    every configuration, e.g. `-b 500 --discount .99`. Env calls are counted
+    on all the envs of the trainer (--n_envs, --pipeline included), so
+    collectors running outside this process (--n_workers, --async_collect)
+    are refused.
+"""
+import contextlib
+import io
+import json
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import tensorflow as tf
+
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+from run_ushiriki_psearch import PG_Trainer, build_parser
+
+CONFIGS = OrderedDict([
+    ('pg', []),
+    ('rtg', ['-rtg']),
+    ('nn_baseline', ['-rtg', '--nn_baseline']),
+    ('gae', ['-rtg', '--nn_baseline', '--gae']),
+    ('multistep_2', ['-rtg', '--nn_baseline', '-ms', '2']),
+    ('multistep_4', ['-rtg', '--nn_baseline', '-ms', '4']),
+])
+
+
+def policy_return(policy, eval_env):
+    """
+        Return of the mean action of the policy at every year
+    """
+    years = np.arange(1, eval_env.policyDimension + 1, dtype=np.float32)
+    actions = policy.get_action(years[:, None], deterministic=True)
+    return eval_env.evaluatePolicy(
+        {str(year): [float(a) for a in action]
+         for year, action in zip(range(1, len(years) + 1), actions)})
+
+
+def env_calls(rl_trainer):
+    """
+        Env calls made so far by all the in-process envs of the trainer
+    """
+    envs = [rl_trainer.env]
+    if rl_trainer.vec_env is not None:
+        envs += rl_trainer.vec_env.envs
+    if rl_trainer.pipeline_executor is not None:
+        envs.append(rl_trainer.pipeline_env)
+    return sum(env.n_calls for env in envs)
+
+
+def run_config(args, thresholds, seed, verbose=False):
+    """
+        Train one configuration with one seed
+
+        returns the returns after each iteration, and for every threshold
+        reached, the iteration, env calls, wall and CPU seconds it took
+    """
+    logdir = tempfile.mkdtemp(prefix='sample_efficiency_')
+    params = vars(build_parser().parse_args(
+        args + ['--env_backend', 'local', '--seed', str(seed),
+                '--scalar_log_freq', '-1', '--video_log_freq', '-1']))
+    params['train_batch_size'] = params['batch_size']
+    params['logdir'] = logdir
+
+    eval_env = LocalUshirikiEnvironment()
+    history = []
+    reached = OrderedDict()
+
+    output = contextlib.nullcontext() if verbose else \
+        contextlib.redirect_stdout(io.StringIO())
+    tf.reset_default_graph()
+    try:
+        with output:
+            trainer = PG_Trainer(params)
+            rl_trainer = trainer.rl_trainer
+            start_wall, start_cpu = time.time(), time.process_time()
+
+            def on_iteration(itr):
+                ret = policy_return(rl_trainer.agent.actor, eval_env)
+                history.append(ret)
+                for threshold in thresholds:
+                    if threshold not in reached and ret >= threshold:
+                        reached[threshold] = {
+                            'itr': itr,
+                            'env_calls': env_calls(rl_trainer),
+                            'env_steps': rl_trainer.total_envsteps,
+                            'wall_secs': time.time() - start_wall,
+                            'cpu_secs': time.process_time() - start_cpu}
+                return len(reached) == len(thresholds)
+
+            trainer.run_training_loop(iteration_callback=on_iteration)
+            rl_trainer.sess.close()
+    finally:
+        shutil.rmtree(logdir, ignore_errors=True)
+    return history, reached
+
+
+def summarize(runs, configs, thresholds):
+    """
+        Per configuration and threshold: the fraction of seeds reaching it,
+        and the median cost over the seeds that did
+    """
+    rows = []
+    for name in configs:
+        for threshold in thresholds:
+            costs = [run['reached'][threshold] for run in runs
+                     if run['config'] == name and threshold in run['reached']]
+            n_seeds = sum(run['config'] == name for run in runs)
+            row = OrderedDict(config=name, threshold=threshold,
+                              reached='{}/{}'.format(len(costs), n_seeds))
+            for key in ('env_calls', 'wall_secs', 'cpu_secs'):
+                row[key] = np.median([cost[key] for cost in costs]) \
+                    if costs else float('nan')
+            rows.append(row)
+    return rows
+
+
+def print_table(rows):
+    print('{:<14} {:>10} {:>8} {:>12} {:>10} {:>10}'.format(
+        'config', 'threshold', 'reached', 'env calls', 'wall (s)', 'cpu (s)'))
+    for row in rows:
+        print('{:<14} {:>10g} {:>8} {:>12.0f} {:>10.1f} {:>10.1f}'.format(
+            row['config'], row['threshold'], row['reached'],
+            row['env_calls'], row['wall_secs'], row['cpu_secs']))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Env calls, wall and CPU time to reach reward thresholds')
+    parser.add_argument('--configs', type=str, nargs='+',
+                        default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        default=[25., 30., 35.])
+    parser.add_argument('--n_iter', type=int, default=100)
+    parser.add_argument('--output', type=str, default='sample_efficiency.json')
+    parser.add_argument('--verbose', action='store_true')
+    args, trainer_args = parser.parse_known_args()
+
+    trainer_params = vars(build_parser().parse_args(trainer_args))
+    if trainer_params['n_workers'] or trainer_params['async_collect']:
+        parser.error('the env calls of --n_workers and --async_collect '
+                     'are made outside this process and cannot be counted')
+
+    thresholds = sorted(args.thresholds)
+    runs = []
+    for name in args.configs:
+        for seed in args.seeds:
+            history, reached = run_config(
+                CONFIGS[name] + ['--n_iter', str(args.n_iter)] + trainer_args,
+                thresholds, seed, args.verbose)
+            runs.append({'config': name, 'seed': seed,
+                         'returns': history, 'reached': reached})
+            print('{} seed {}: final return {:.2f} after {} iterations, '
+                  'reached {}'.format(name, seed, history[-1], len(history),
+                                      list(reached) or 'none'))
+
+    rows = summarize(runs, args.configs, thresholds)
+    print()
+    print_table(rows)
+
+    with open(args.output, 'w') as f:
+        json.dump({'thresholds': thresholds, 'trainer_args': trainer_args,
+                   'runs': runs, 'summary': rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import os
 import time
 
-from ushirik.infrastructure.rl_trainer import RL_Trainer
+from ushiriki.infrastructure.rl_trainer import RL_Trainer
 from ushiriki.agents.pg_agent import PGAgent
 
 
@@ -17,6 +17,7 @@ class PG_Trainer(object):
             'n_layers': params['n_layers'],
             'size': params['size'],
             'learning_rate': params['learning_rate'],
+            'memoize_actions': params['memoize_actions'],
         }
 
         estimate_advantage_args = {
@@ -25,7 +26,9 @@ class PG_Trainer(object):
             'reward_to_go': params['reward_to_go'],
             'nn_baseline': params['nn_baseline'],
             'gae': params['gae'],
-            'lambda': params['lambda']
+            'lambda': params['lambda'],
+            'joint_baseline_step': params['joint_baseline_step'],
+            'is_clip': params['is_clip']
         }
 
         train_args = {
@@ -34,7 +37,9 @@ class PG_Trainer(object):
             'multistep': params['multistep']
         }
 
-        ushiriki_creds = {'user': params['user'], 'baseuri': creds['baseuri']}
+        ushiriki_creds = {'user': params['user'], 'baseuri': params['baseuri']}
+        if params['experiment_count'] is not None:
+            ushiriki_creds['experimentCount'] = params['experiment_count']
 
         agent_params = {**computation_graph_args, **estimate_advantage_args, **train_args}
 
@@ -50,16 +55,17 @@ class PG_Trainer(object):
 
         self.rl_trainer = RL_Trainer(self.params)
 
-    def run_training_loop(self):
+    def run_training_loop(self, iteration_callback=None):
 
         self.rl_trainer.run_training_loop(
             self.params['n_iter'],
             collect_policy=self.rl_trainer.agent.actor,
             eval_policy=self.rl_trainer.agent.actor,
+            iteration_callback=iteration_callback,
         )
 
 
-def main():
+def build_parser():
 
     import argparse
     parser = argparse.ArgumentParser()
@@ -74,6 +80,21 @@ def main():
     parser.add_argument('--baseuri',
                         type=str,
                         default="http://alpha-upe-challenge.eu-gb.mybluemix.net")
+    # Evaluations the whole run may request, over all of its envs
+    parser.add_argument('--experiment_count', type=int, default=None)
+    # Reward backend: the hosted challenge API, or the offline simulator
+    parser.add_argument('--env_backend', type=str, default='remote',
+                        choices=['remote', 'local'])
+    # On-disk reward cache (sqlite file) in front of the env
+    parser.add_argument('--reward_cache', type=str, default=None)
+    parser.add_argument('--cache_quantum', type=float, default=1e-2)
+    parser.add_argument('--cache_size', type=int, default=1000000)
+    # On-disk rollout store (directory), and how much of it to preload
+    parser.add_argument('--rollout_store', type=str, default=None)
+    parser.add_argument('--store_segment_steps', type=int, default=1000000)
+    # fsync the store index every n appends instead of after each one
+    parser.add_argument('--store_sync_every', type=int, default=1)
+    parser.add_argument('--warm_start_steps', type=int, default=0)
 
     parser.add_argument('--reward_to_go', '-rtg', action='store_true')
     parser.add_argument('--nn_baseline', action='store_true')
@@ -98,16 +119,55 @@ def main():
     parser.add_argument('--which_gpu', '-gpu_id', default=0)
     parser.add_argument('--video_log_freq', type=int,
                         default=-1)   # video log disabled
+    # -1 disables scalar logging, and the eval rollouts it collects
     parser.add_argument('--scalar_log_freq', type=int, default=1)
+    # Time the phases of every iteration (Perf/ scalars, perf_summary.jsonl)
+    parser.add_argument('--profile', action='store_true')
+    # Save a Chrome trace of the run (episodes, env requests, sess.run, phases)
+    parser.add_argument('--trace', type=str, default=None)
+    # Queue log calls for a background writer, flushed every log_flush_secs
+    parser.add_argument('--async_logging', action='store_true')
+    parser.add_argument('--log_flush_secs', type=float, default=10.)
+    parser.add_argument('--log_queue_size', type=int, default=1000)
     # Parallelize trajectory collection
     parser.add_argument('--parallel', action='store_true')
+    # Envs stepped in lockstep, sharing one batched policy forward pass
+    parser.add_argument('--n_envs', type=int, default=1)
+    # Concurrent episodes, each on its own env, requests sent from threads
+    parser.add_argument('--async_collect', action='store_true')
+    parser.add_argument('--max_concurrency', type=int, default=32)
+    # Rollout worker processes, each with its own env (0: collect in-process)
+    parser.add_argument('--n_workers', type=int, default=0)
+    # Hand episodes to the agent as they finish, while collection goes on
+    parser.add_argument('--stream_collect', action='store_true')
+    # Collect the next batches in the background while training on this one,
+    # with rollouts at most max_staleness iterations old
+    parser.add_argument('--pipeline', action='store_true')
+    parser.add_argument('--max_staleness', type=int, default=1)
+    # Truncation of the importance weights of stale rollouts
+    parser.add_argument('--is_clip', type=float, default=1.)
+    # Evaluate whole policies at once, states being independent of actions
+    parser.add_argument('--open_loop', action='store_true')
+    # Query the policy from a NumPy copy of its weights, not the TF session
+    parser.add_argument('--numpy_inference', action='store_true')
+    # Reuse the action distribution of already seen observations (years)
+    parser.add_argument('--memoize_actions', action='store_true')
     # GAE for advantage estimation
     parser.add_argument('--gae', action='store_true')
     parser.add_argument('--lambda', type=float, default=.95)
+    # Policy and baseline Adam steps in a single sess.run
+    parser.add_argument('--joint_baseline_step', action='store_true')
     parser.add_argument('--save_params', action='store_true')
+    # Keep the TF graph open to new ops after construction
+    parser.add_argument('--dont_finalize_graph', dest='finalize_graph',
+                        action='store_false')
     parser.add_argument('--multistep', '-ms', type=int, default=1)
+    return parser
+
+
+def main():
 
-    args = parser.parse_args()
+    args = build_parser().parse_args()
 
     # convert to dictionary
     params = vars(args)
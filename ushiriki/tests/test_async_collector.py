@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from ushiriki.infrastructure.async_collector import AsyncRolloutCollector
+from ushiriki.infrastructure.env_utils import EvaluationBudget, make_env
+
+
+class YearPolicy(object):
+
+    def get_action(self, ob):
+        year = float(np.ravel(ob)[0])
+        return np.array([[year / 10., 1. - year / 10.]])
+
+
+def test_concurrent_episodes_spend_from_one_budget():
+    budget = EvaluationBudget()
+    made = []
+
+    def make(index):
+        made.append(index)
+        return make_env('local', {}, seed=index, budget=budget)
+
+    collector = AsyncRolloutCollector(make, max_concurrency=4)
+    try:
+        batch, n_steps = collector.sample_trajectories(YearPolicy(), 20, 5)
+        assert n_steps == 20 and len(batch) == 4
+        assert batch.offsets.tolist() == [0, 5, 10, 15, 20]
+        # the same rewards as one episode on one env
+        expected = make_env('local', {}).evaluatePolicySteps(
+            [{str(year): [year / 10., 1. - year / 10.] for year in range(1, 6)}])
+        np.testing.assert_allclose(batch[2]['reward'], expected[0], rtol=1e-5)
+
+        collector.sample_trajectories(YearPolicy(), 10, 5)
+    finally:
+        collector.close()
+    # every step is a request; envs are reused across batches
+    assert budget.spent == 30
+    assert len(made) <= 4
+
+
+def test_exhausted_budget_stops_collection():
+    budget = EvaluationBudget(limit=12)
+    collector = AsyncRolloutCollector(
+        lambda index: make_env('local', {}, budget=budget), max_concurrency=2)
+    try:
+        with pytest.raises(ValueError):
+            collector.sample_trajectories(YearPolicy(), 20, 5)
+    finally:
+        collector.close()
+    assert budget.spent == 12
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow_probability')
+tf = pytest.importorskip('tensorflow')
+if not hasattr(tf, 'placeholder'):
+    pytest.skip('the policies need the TF1 graph API', allow_module_level=True)
+
+from ushiriki.agents.bc_agent import BCAgent
+from ushiriki.infrastructure.expert_data import ExpertDataReader, write_columnar
+from ushiriki.infrastructure.rollout_store import RolloutStore
+
+
+def make_path(length, first=0.):
+    # the expert's action is a fixed function of the observation
+    obs = first + np.linspace(0., 1., length, dtype=np.float32)[:, None]
+    terminals = np.zeros(length)
+    terminals[-1] = 1
+    return {'observation': obs, 'image_obs': np.array([]),
+            'action': np.exp(np.hstack([obs, -obs])),
+            'reward': np.zeros(length, dtype=np.float32),
+            'next_observation': obs, 'terminal': terminals}
+
+
+def make_agent(rollout_store=None):
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.set_random_seed(0)
+        sess = tf.Session(graph=graph)
+        agent = BCAgent(sess, None, {
+            'ac_dim': 2, 'ob_dim': 1, 'n_layers': 2, 'size': 16,
+            'discrete': False, 'learning_rate': 1e-2, 'seed': 0,
+            'rollout_store': rollout_store})
+        sess.run(tf.global_variables_initializer())
+    return graph, agent
+
+
+def train(graph, agent, n_steps, batch_size=32):
+    with graph.as_default():
+        return [agent.train(*agent.sample(batch_size)) for _ in range(n_steps)]
+
+
+def test_bc_agent_trains_from_a_columnar_dataset(tmp_path):
+    write_columnar([make_path(50, i) for i in range(4)], str(tmp_path))
+    graph, agent = make_agent()
+    agent.set_expert_data(ExpertDataReader(str(tmp_path)))
+
+    losses = train(graph, agent, 300)
+    assert losses[-1] < 0.05 * losses[0]
+
+    obs = np.array([[0.5], [2.5]], dtype=np.float32)
+    with graph.as_default():
+        action = agent.actor.get_action(obs, deterministic=True)
+    np.testing.assert_allclose(np.log(action), np.hstack([obs, -obs]), atol=0.2)
+
+
+def test_bc_agent_warm_starts_from_the_rollout_store(tmp_path):
+    store = RolloutStore(str(tmp_path), segment_steps=64)
+    store.append([make_path(50, i) for i in range(4)])
+    graph, agent = make_agent(rollout_store=store)
+
+    # only the most recent whole episodes that fit are loaded
+    assert agent.replay_buffer.load_from_store(max_steps=120) == 100
+    assert len(agent.replay_buffer) == 100
+    obs, _, _, _, _ = agent.sample(100)
+    assert obs.min() >= 2.
+
+    losses = train(graph, agent, 100)
+    assert losses[-1] < losses[0]
+    store.close()
@@ -0,0 +1,13 @@
+from ushiriki.infrastructure.env_utils import TracedEnvironment
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+
+
+def test_traced_env_forwards_attribute_writes():
+    base = LocalUshirikiEnvironment()
+    env = TracedEnvironment(base)
+    env.reset()
+
+    env.state = 3
+    assert base.state == 3 and 'state' not in vars(env)
+    state, _, _, _ = env.step([.5, .5])
+    assert state == 4 and base.state == 4
@@ -0,0 +1,36 @@
+import numpy as np
+
+from ushiriki.infrastructure.expert_data import ExpertDataReader, write_columnar
+
+
+def make_path(length, first=0.):
+    obs = np.arange(1, length + 1, dtype=np.float32)[:, None]
+    terminals = np.zeros(length)
+    terminals[-1] = 1
+    return {'observation': obs, 'image_obs': np.array([]),
+            'action': np.zeros((length, 2)),
+            'reward': first + np.arange(length, dtype=np.float32),
+            'next_observation': obs + 1, 'terminal': terminals}
+
+
+def test_episode_returns_in_chunks(tmp_path):
+    paths = [make_path(length, first) for length, first in
+             [(3, 0.), (1, 5.), (4, 1.), (2, 10.), (5, 0.)]]
+    write_columnar(paths, str(tmp_path))
+    reader = ExpertDataReader(str(tmp_path))
+
+    expected = [path['reward'].sum() for path in paths]
+    for chunk_episodes in (1, 2, 5, 100):
+        np.testing.assert_allclose(reader.episode_returns(chunk_episodes), expected)
+
+
+def test_shuffled_transitions_cover_the_dataset_once(tmp_path):
+    paths = [make_path(5, 10. * i) for i in range(4)]
+    write_columnar(paths, str(tmp_path))
+    reader = ExpertDataReader(str(tmp_path))
+
+    batches = list(reader.iter_transitions(6, shuffle=True, seed=0))
+    assert [len(batch[2]) for batch in batches] == [6, 6, 6, 2]
+    rewards = np.concatenate([batch[2] for batch in batches])
+    np.testing.assert_array_equal(
+        np.sort(rewards), np.sort(np.concatenate([path['reward'] for path in paths])))
@@ -0,0 +1,68 @@
+import numpy as np
+
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+
+ACTIONS = np.array([[.5, .2], [.1, .9], [.7, .7], [0., 1.], [1., 0.]])
+
+
+def policy_dict(actions):
+    return {str(year): list(ac) for year, ac in enumerate(actions, 1)}
+
+
+def test_step_by_step_matches_batch_evaluation():
+    env = LocalUshirikiEnvironment()
+    assert env.reset().tolist() == [1]
+
+    rewards = []
+    for year, ac in enumerate(ACTIONS, 1):
+        state, rew, done, _ = env.evaluateAction(ac)
+        rewards.append(rew)
+        assert state == year + 1
+        assert done == (year == env.policyDimension)
+
+    np.testing.assert_allclose(
+        rewards, env.evaluate_actions_batch(ACTIONS[None])[0])
+    np.testing.assert_allclose(
+        env.evaluatePolicy(policy_dict(ACTIONS)), sum(rewards))
+
+
+def test_reward_depends_on_earlier_actions():
+    env = LocalUshirikiEnvironment()
+    other = ACTIONS.copy()
+    other[0] = [1., 1.]
+    rewards = env.evaluate_actions_batch(np.stack([ACTIONS, other]))
+    # same action in year 2, different prevalence carried over from year 1
+    assert rewards[0, 1] != rewards[1, 1]
+
+
+def test_step_batch_matches_single_episodes():
+    env = LocalUshirikiEnvironment()
+    batch = np.stack([ACTIONS, ACTIONS[::-1]])
+    obs = env.reset_batch(2)
+    assert obs.tolist() == [[1.], [1.]]
+
+    rewards = []
+    for year in range(env.policyDimension):
+        obs, rew, dones, _ = env.step_batch(batch[:, year])
+        rewards.append(rew)
+    assert dones.all()
+    np.testing.assert_allclose(np.stack(rewards, axis=1),
+                               env.evaluate_actions_batch(batch))
+
+
+def test_no_intervention_has_no_reward_and_actions_are_clipped():
+    env = LocalUshirikiEnvironment()
+    np.testing.assert_allclose(
+        env.evaluate_actions_batch(np.zeros((1, 5, 2))), 0.)
+    np.testing.assert_allclose(
+        env.evaluate_actions_batch(np.full((1, 5, 2), 2.)),
+        env.evaluate_actions_batch(np.ones((1, 5, 2))))
+
+
+def test_calls_are_counted_per_action_and_per_policy():
+    env = LocalUshirikiEnvironment()
+    env.evaluateAction(ACTIONS[0])
+    env.evaluatePolicy([policy_dict(ACTIONS)] * 3)
+    env.reset_batch(4)
+    env.step_batch(np.zeros((4, 2)))
+    assert env.n_calls == 1 + 3 + 4
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+pytest.importorskip('tensorboardX')
+
+from ushiriki.infrastructure import logger
+
+
+class FailingWriter(object):
+    """
+        SummaryWriter stand-in whose scalar writes fail
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.written = []
+        self.closed = False
+
+    def add_scalar(self, name, value, step):
+        if name == 'bad':
+            raise IOError('disk full')
+        self.written.append((name, value, step))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def async_logger(monkeypatch, tmp_path):
+    monkeypatch.setattr(logger, 'SummaryWriter', FailingWriter)
+    return logger.Logger(str(tmp_path), async_mode=True, flush_secs=.1, queue_size=2)
+
+
+def returns_in_time(fn, timeout=5.):
+    """
+        Call fn in a thread, fail if it hangs, return what it raised
+    """
+    outcome = {}
+
+    def target():
+        try:
+            fn()
+        except Exception as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), '{} hung'.format(fn.__name__)
+    return outcome.get('error')
+
+
+def test_flush_reports_the_writer_error(async_logger):
+    async_logger.log_scalar(1., 'good', 0)
+    async_logger.log_scalar(2., 'bad', 1)
+    async_logger.log_scalar(3., 'good', 2)
+
+    error = returns_in_time(async_logger.flush)
+    assert isinstance(error, IOError) and str(error) == 'disk full'
+    # nothing is written after the failure
+    assert async_logger._summ_writer.written == [('good', 1., 0)]
+
+    # reported once, close then stops the writer cleanly
+    assert returns_in_time(async_logger.close) is None
+    assert async_logger._summ_writer.closed
+    assert not async_logger._writer.is_alive()
+
+
+def test_close_reports_the_writer_error(async_logger):
+    async_logger.log_scalar(2., 'bad', 0)
+
+    error = returns_in_time(async_logger.close)
+    assert isinstance(error, IOError)
+    assert async_logger._summ_writer.closed
+
+
+def test_logging_to_a_stopped_writer_raises(async_logger):
+    assert returns_in_time(async_logger.close) is None
+
+    # the queue would never drain again
+    def log_past_the_queue_size():
+        for step in range(5):
+            async_logger.log_scalar(1., 'good', step)
+    error = returns_in_time(log_past_the_queue_size)
+    assert isinstance(error, RuntimeError)
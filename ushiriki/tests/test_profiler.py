@@ -0,0 +1,62 @@
+import types
+
+import pytest
+
+from ushiriki.infrastructure import profiler
+from ushiriki.infrastructure.profiler import PhaseTimer
+from ushiriki.infrastructure.tracer import tracer
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(profiler, 'time', types.SimpleNamespace(
+        perf_counter=clock.perf_counter))
+    return clock
+
+
+def test_nested_phases_add_up(clock):
+    timer = PhaseTimer(enabled=True)
+
+    @timer.timed('update')
+    def update():
+        clock.now += 2.
+
+    for _ in range(2):
+        with timer.phase('iteration'):
+            with timer.phase('collect'):
+                clock.now += 1.
+                timer.count('episodes', 3)
+            update()
+            update()
+
+    summary = timer.summary()
+    assert summary['phases'] == {
+        'collect': {'seconds': 2., 'calls': 2},
+        'iteration': {'seconds': 10., 'calls': 2},
+        'update': {'seconds': 8., 'calls': 4}}
+    assert summary['counters'] == {'episodes': 6}
+
+    timer.reset()
+    assert timer.summary() == {'phases': {}, 'counters': {}}
+
+
+def test_disabled_timer_records_nothing(clock):
+    assert not tracer.enabled
+    timer = PhaseTimer()
+
+    # no context manager is built per call, the shared no-op is reused
+    assert timer.phase('collect') is timer.phase('update')
+    with timer.phase('collect'):
+        clock.now += 1.
+        timer.count('episodes')
+
+    assert timer.summary() == {'phases': {}, 'counters': {}}
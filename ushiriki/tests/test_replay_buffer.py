@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from ushiriki.infrastructure.replay_buffer import ReplayBuffer
+from ushiriki.infrastructure.utils import Path
+
+
+def make_path(length, first=0.):
+    obs = np.arange(1, length + 1, dtype=np.float32)[:, None]
+    terminals = np.zeros(length)
+    terminals[-1] = 1
+    rews = first + np.arange(length, dtype=np.float32)
+    return Path(obs, [], np.zeros((length, 2)), rews, obs + 1, terminals)
+
+
+def test_recent_episodes_come_back_whole():
+    buffer = ReplayBuffer(max_size=8)
+    buffer.add_rollouts([make_path(3, 0.), make_path(3, 10.)])
+    buffer.add_rollouts([make_path(3, 20.)])
+
+    # the first episode was partly overwritten, only two remain indexed
+    assert len(buffer) == 8
+    paths = buffer.sample_recent_rollouts(5)
+    assert [path['reward'].tolist() for path in paths] == \
+        [[10., 11., 12.], [20., 21., 22.]]
+
+    _, _, rews, _, _ = buffer.sample_recent_data(4, concat_rew=False)
+    assert [r.tolist() for r in rews] == [[10., 11., 12.], [20., 21., 22.]]
+
+
+def test_episode_longer_than_the_buffer_is_rejected():
+    buffer = ReplayBuffer(max_size=4)
+    buffer.add_rollouts([make_path(3)])
+    with pytest.raises(ValueError):
+        buffer.add_rollouts([make_path(2), make_path(5)])
+
+    # nothing of the rejected batch was added
+    assert buffer.total_added == 3
+    assert [path['reward'].tolist() for path in buffer.sample_recent_rollouts(2)] == \
+        [[0., 1., 2.]]
+
+
+def test_random_data_is_sampled_without_replacement():
+    buffer = ReplayBuffer(max_size=100)
+    buffer.add_rollouts([make_path(100)])
+
+    np.random.seed(0)
+    for batch_size in (1, 10, 99, 100, 500):
+        obs, _, _, _, _ = buffer.sample_random_data(batch_size)
+        rows = obs[:, 0].tolist()
+        assert len(rows) == min(batch_size, 100)
+        assert len(set(rows)) == len(rows)
+        assert set(rows) <= set(range(1, 101))
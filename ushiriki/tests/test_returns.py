@@ -0,0 +1,74 @@
+import numpy as np
+
+from ushiriki.infrastructure import returns
+
+REWARDS = [np.array([1., 2., 3.]), np.array([4.]), np.array([5., 6.])]
+
+
+def loop_reward_to_go(rews, gamma):
+    return np.array([sum(gamma ** (k - t) * rews[k] for k in range(t, len(rews)))
+                     for t in range(len(rews))])
+
+
+def loop_gae(rewards, values, terminals, gamma, lamda):
+    adv = np.zeros(len(rewards))
+    for t in reversed(range(len(rewards))):
+        if terminals[t]:
+            adv[t] = rewards[t] - values[t]
+        else:
+            delta = rewards[t] + gamma * values[t + 1] - values[t]
+            adv[t] = delta + gamma * lamda * adv[t + 1]
+    return adv
+
+
+def test_pad_and_unpad_round_trip():
+    padded, mask = returns.pad_rewards(REWARDS)
+    assert padded.shape == (3, 3)
+    assert mask.sum(axis=1).tolist() == [3, 1, 2]
+    np.testing.assert_array_equal(returns.unpad(padded, mask),
+                                  np.concatenate(REWARDS))
+
+
+def test_discounted_returns_are_constant_per_rollout():
+    padded, mask = returns.pad_rewards(REWARDS)
+    q = returns.unpad(returns.discounted_returns(padded, mask, .9), mask)
+    expected = np.concatenate([
+        np.full(len(r), sum(.9 ** t * x for t, x in enumerate(r)))
+        for r in REWARDS])
+    np.testing.assert_allclose(q, expected, rtol=1e-6)
+
+
+def test_reward_to_go_matches_the_definition():
+    padded, mask = returns.pad_rewards(REWARDS)
+    rtg = returns.reward_to_go(padded, mask, .9)
+    np.testing.assert_allclose(
+        returns.unpad(rtg, mask),
+        np.concatenate([loop_reward_to_go(r, .9) for r in REWARDS]), rtol=1e-6)
+    # padded steps stay zero
+    assert (rtg[~mask] == 0).all()
+
+
+def test_episode_lengths_include_a_truncated_tail():
+    assert returns.episode_lengths([0, 0, 1, 1, 0, 0]).tolist() == [3, 1, 2]
+    assert returns.episode_lengths([0, 1]).tolist() == [2]
+
+
+def test_gae_matches_the_per_step_loop():
+    rng = np.random.RandomState(0)
+    terminals = np.zeros(23)
+    terminals[[4, 9, 10, 22]] = 1
+    rewards = rng.standard_normal(23)
+    values = rng.standard_normal(23)
+    np.testing.assert_allclose(
+        returns.gae(rewards, values, terminals, .99, .95),
+        loop_gae(rewards, values, terminals, .99, .95), rtol=1e-10)
+
+
+def test_gae_with_lambda_one_is_reward_to_go_minus_values():
+    rewards = np.array([1., 2., 3., 4.])
+    values = np.array([.5, .1, .2, .3])
+    terminals = np.array([0, 1, 0, 1])
+    expected = np.concatenate([loop_reward_to_go(rewards[:2], .9),
+                               loop_reward_to_go(rewards[2:], .9)]) - values
+    np.testing.assert_allclose(
+        returns.gae(rewards, values, terminals, .9, 1.), expected)
@@ -0,0 +1,127 @@
+import numpy as np
+
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+from ushiriki.infrastructure.reward_cache import (CachedUshirikiEnvironment,
+                                                  RewardCache)
+
+EPISODE = [[.5, .2], [.1, .9], [.7, .7], [0., 1.], [1., 0.]]
+
+
+def run_episode(env, actions):
+    env.reset()
+    return [env.evaluateAction(ac) for ac in actions]
+
+
+def test_action_keys_cover_the_earlier_actions(tmp_path):
+    cache = RewardCache(str(tmp_path / 'cache.sqlite'), quantum=1e-2)
+    assert cache.action_key([[.5, .2]], [.1, .9]) == \
+        cache.action_key([[.501, .2]], [.1, .899])
+    assert cache.action_key([[.5, .2]], [.1, .9]) != \
+        cache.action_key([[.9, .2]], [.1, .9])
+    assert cache.action_key([], [.1, .9]) != \
+        cache.action_key([[.5, .2]], [.1, .9])
+
+
+def test_cached_rewards_match_the_env(tmp_path):
+    cache = RewardCache(str(tmp_path / 'cache.sqlite'))
+    base = LocalUshirikiEnvironment()
+    env = CachedUshirikiEnvironment(base, cache)
+
+    expected = run_episode(LocalUshirikiEnvironment(), EPISODE)
+    assert run_episode(env, EPISODE) == expected
+    calls = base.n_calls
+
+    # a fully cached episode costs no call
+    assert run_episode(env, EPISODE) == expected
+    assert base.n_calls == calls
+    assert cache.stats()['hits'] == len(EPISODE)
+
+
+def test_same_action_after_other_history_is_a_miss(tmp_path):
+    cache = RewardCache(str(tmp_path / 'cache.sqlite'))
+    env = CachedUshirikiEnvironment(LocalUshirikiEnvironment(), cache)
+    run_episode(env, EPISODE)
+
+    other = [[1., 1.]] + EPISODE[1:]
+    assert run_episode(env, other) == \
+        run_episode(LocalUshirikiEnvironment(), other)
+
+
+def test_miss_after_hits_replays_the_episode_to_the_env(tmp_path):
+    cache = RewardCache(str(tmp_path / 'cache.sqlite'))
+    base = LocalUshirikiEnvironment()
+    env = CachedUshirikiEnvironment(base, cache)
+    run_episode(env, EPISODE)
+
+    # hits for the first two years, then a new action
+    diverging = EPISODE[:2] + [[.3, .3]] + EPISODE[3:]
+    results = run_episode(env, diverging)
+    assert results == run_episode(LocalUshirikiEnvironment(), diverging)
+    assert len(base.history) == len(diverging)
+    assert results[-1][2]
+
+
+def test_policies_are_evaluated_once(tmp_path):
+    cache = RewardCache(str(tmp_path / 'cache.sqlite'))
+    base = LocalUshirikiEnvironment()
+    env = CachedUshirikiEnvironment(base, cache)
+    policy = {str(year): ac for year, ac in enumerate(EPISODE, 1)}
+
+    rewards = env.evaluatePolicy([policy, policy])
+    assert rewards[0] == rewards[1] == \
+        LocalUshirikiEnvironment().evaluatePolicy(policy)
+    assert env.evaluatePolicy(policy) == rewards[0]
+    assert base.n_calls == 1
+
+
+def test_hits_do_not_lock_the_file_for_other_processes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    a = RewardCache(path)
+    b = RewardCache(path)
+    b._db.execute('PRAGMA busy_timeout = 100')
+
+    a.put('k', 1.)
+    assert a.get('k') == 1.
+    b.put('other', 2.)
+    assert b.get('k') == 1.
+    a.close()
+    b.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = RewardCache(path, max_entries=2)
+    cache.put('a', 1.)
+    cache.put('b', 2.)
+    cache.get('a')
+    cache.put('c', 3.)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1. and cache.get('c') == 3.
+    cache.close()
+
+    # recency and contents persist across runs
+    cache = RewardCache(path, max_entries=2)
+    assert cache.stats()['size'] == 2
+    np.testing.assert_equal(cache.get('c'), 3.)
+
+
+def test_policy_steps_share_the_action_keys(tmp_path):
+    cache = RewardCache(str(tmp_path / 'cache.sqlite'))
+    base = LocalUshirikiEnvironment()
+    env = CachedUshirikiEnvironment(base, cache)
+    policy = {str(year): ac for year, ac in enumerate(EPISODE, 1)}
+    other = dict(policy, **{'5': [.3, .3]})
+
+    expected = LocalUshirikiEnvironment().evaluatePolicySteps([policy, other])
+    rewards = env.evaluatePolicySteps([policy, other, policy])
+    np.testing.assert_allclose(rewards, [expected[0], expected[1], expected[0]])
+    # the repeated policy was evaluated once, and nothing was a hit
+    assert base.n_calls == 2
+    assert cache.stats()['hits'] == 0
+
+    # served from the cache, by the step-by-step path too
+    np.testing.assert_allclose(env.evaluatePolicySteps([other]), [expected[1]])
+    assert run_episode(env, EPISODE) == \
+        run_episode(LocalUshirikiEnvironment(), EPISODE)
+    assert base.n_calls == 2
+    assert cache.stats()['hits'] == 2 * len(EPISODE)
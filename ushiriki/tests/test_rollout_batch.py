@@ -0,0 +1,52 @@
+import numpy as np
+
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+from ushiriki.infrastructure.utils import (RolloutBatch, sample_trajectories,
+                                           sample_trajectory)
+
+
+class YearPolicy(object):
+    """
+        Deterministic policy, the action only depends on the year
+    """
+
+    def get_action(self, ob):
+        year = float(np.ravel(ob)[0])
+        return np.array([[year / 10., 1. - year / 10.]])
+
+
+def test_single_episode_as_a_rollout_dict():
+    path = sample_trajectory(LocalUshirikiEnvironment(), YearPolicy(), 3)
+    assert path['observation'].ravel().tolist() == [1., 2., 3.]
+    assert path['next_observation'].ravel().tolist() == [2., 3., 4.]
+    assert path['terminal'].tolist() == [0., 0., 1.]
+    np.testing.assert_allclose(path['action'][:, 0], [.1, .2, .3], rtol=1e-6)
+    assert len(path['image_obs']) == 0
+
+
+def test_batch_matches_episode_by_episode():
+    path = sample_trajectory(LocalUshirikiEnvironment(), YearPolicy(), 5)
+    batch, n_steps = sample_trajectories(LocalUshirikiEnvironment(), YearPolicy(), 12, 5)
+
+    # three whole episodes, the last one overshooting the target
+    assert n_steps == 15 and batch.num_steps == 15
+    assert batch.offsets.tolist() == [0, 5, 10, 15]
+    assert len(batch.reward) == 15
+    for episode in batch:
+        for name in RolloutBatch.FIELDS:
+            np.testing.assert_array_equal(episode[name], path[name])
+
+
+def test_episodes_append_to_a_given_batch():
+    batch = RolloutBatch.empty(6)
+    env, policy = LocalUshirikiEnvironment(), YearPolicy()
+    assert sample_trajectory(env, policy, 2, batch=batch) is batch
+    sample_trajectory(env, policy, 4, batch=batch)
+    assert batch.trim().offsets.tolist() == [0, 2, 6]
+    assert batch.episode_lengths().tolist() == [2, 4]
+    assert batch.terminal.tolist() == [0., 1., 0., 0., 0., 1.]
+
+
+def test_no_steps_requested():
+    batch, n_steps = sample_trajectories(LocalUshirikiEnvironment(), YearPolicy(), 0, 5)
+    assert n_steps == 0 and len(batch) == 0
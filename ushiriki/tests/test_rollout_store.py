@@ -0,0 +1,53 @@
+import numpy as np
+
+from ushiriki.infrastructure import rollout_store
+from ushiriki.infrastructure.rollout_store import RolloutStore
+
+
+def make_path(length, first=0.):
+    obs = np.arange(1, length + 1, dtype=np.float32)[:, None]
+    terminals = np.zeros(length)
+    terminals[-1] = 1
+    return {'observation': obs, 'action': np.zeros((length, 2)),
+            'reward': first + np.arange(length, dtype=np.float32),
+            'next_observation': obs + 1, 'terminal': terminals}
+
+
+def test_appends_are_read_back_after_reopening(tmp_path):
+    store = RolloutStore(str(tmp_path), segment_steps=8, sync_every=3)
+    store.append([make_path(5, 0.), make_path(5, 10.)])
+    store.append([make_path(2, 20.)])
+    store.close()
+
+    store = RolloutStore(str(tmp_path))
+    assert len(store) == 3 and store.num_steps == 12
+    # the second episode did not fit after the first one
+    assert store.index['segment'].tolist() == [0, 1, 1]
+    assert store.episode(1)['reward'].tolist() == [10., 11., 12., 13., 14.]
+    assert store.episode(2)['reward'].tolist() == [20., 21.]
+
+
+def test_torn_index_record_is_dropped(tmp_path):
+    store = RolloutStore(str(tmp_path), segment_steps=8)
+    store.append([make_path(3)])
+    store.close()
+    with open(str(tmp_path / 'episodes.idx'), 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    store = RolloutStore(str(tmp_path))
+    assert len(store) == 1
+    store.append([make_path(2, 5.)])
+    assert RolloutStore(str(tmp_path)).episode(1)['reward'].tolist() == [5., 6.]
+
+
+def test_recent_episodes_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(rollout_store, '_INDEX_CHUNK', 2)
+    store = RolloutStore(str(tmp_path), segment_steps=100)
+    lengths = [3, 1, 4, 1, 5, 2]
+    store.append([make_path(length) for length in lengths])
+
+    for max_steps in range(20):
+        expected = len(lengths)
+        while expected and sum(lengths[expected - 1:]) <= max_steps:
+            expected -= 1
+        assert store.recent_episodes(max_steps) == expected
@@ -0,0 +1,73 @@
+import json
+import threading
+
+from ushiriki.infrastructure.env_utils import TracedEnvironment
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+from ushiriki.infrastructure.tracer import Tracer, tracer
+
+
+def load_events(path):
+    with open(path) as f:
+        trace = json.load(f)
+    assert trace['displayTimeUnit'] == 'ms'
+    return trace['traceEvents']
+
+
+def test_save_writes_chrome_trace_events(tmp_path):
+    trace = Tracer(enabled=True)
+    trace.set_process_name('learner')
+    with trace.span('iteration'):
+        with trace.span('collect', cat='env', n_steps=3):
+            pass
+    with trace.async_span('request'):
+        pass
+
+    path = str(tmp_path / 'trace.json')
+    trace.save(path)
+    events = load_events(path)
+
+    spans = [event for event in events if event['ph'] == 'X']
+    # spans are recorded as they end, inner ones first
+    assert [span['name'] for span in spans] == ['collect', 'iteration']
+    for span in spans:
+        assert isinstance(span['ts'], float) and span['dur'] >= 0
+    collect, iteration = spans
+    assert collect['cat'] == 'env' and collect['args'] == {'n_steps': 3}
+    assert iteration['ts'] <= collect['ts']
+    assert collect['ts'] + collect['dur'] <= iteration['ts'] + iteration['dur']
+
+    begin, end = [event for event in events if event['ph'] in 'be']
+    assert (begin['ph'], end['ph']) == ('b', 'e') and begin['id'] == end['id']
+    assert begin['ts'] <= end['ts']
+
+    metadata = {event['name']: event['args']['name']
+                for event in events if event['ph'] == 'M'}
+    assert metadata == {'process_name': 'learner',
+                        'thread_name': threading.current_thread().name}
+
+
+def test_disabled_tracer_records_nothing(tmp_path):
+    trace = Tracer()
+    with trace.span('iteration'), trace.async_span('request'):
+        pass
+
+    path = str(tmp_path / 'trace.json')
+    trace.save(path)
+    assert load_events(path) == []
+
+
+def test_traced_env_records_requests_and_forwards_writes(monkeypatch):
+    monkeypatch.setattr(tracer, 'enabled', True)
+    tracer.drain()
+    base = LocalUshirikiEnvironment()
+    env = TracedEnvironment(base)
+    env.reset()
+
+    env.state = 3
+    assert base.state == 3 and 'state' not in vars(env)
+    env.step([.5, .5])
+    assert base.state == 4
+
+    spans = [event for event in tracer.drain() if event['ph'] == 'X']
+    assert [(span['name'], span['cat']) for span in spans] == \
+        [('evaluateAction', 'env')]
@@ -0,0 +1,125 @@
+import json
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from ushiriki.infrastructure import ushiriki_api
+from ushiriki.infrastructure.local_ushiriki_env import LocalUshirikiEnvironment
+from ushiriki.infrastructure.ushiriki_server import Cassette, UshirikiServer
+
+ACTIONS = [[.5, .2], [.1, .9], [.7, .7], [0., 1.], [1., 0.]]
+
+
+def request(baseuri, path, payload=None):
+    data = None if payload is None else json.dumps(payload).encode('utf-8')
+    req = urllib.request.Request(
+        baseuri + path, data=data, method='GET' if data is None else 'POST',
+        headers=ushiriki_api.HEADERS)
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def evaluate(baseuri, actions):
+    """
+        Reward of the last action, the way ChallengeEnvironment asks for it
+    """
+    _, body = request(baseuri, ushiriki_api.CREATE_PATH,
+                      ushiriki_api.create_payload(actions))
+    action_id = ushiriki_api.parse_data(body)
+    _, body = request(baseuri, ushiriki_api.REWARD_PATH,
+                      ushiriki_api.reward_payload(action_id))
+    return ushiriki_api.parse_data(body)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**kwargs):
+        server = UshirikiServer(('127.0.0.1', 0), **kwargs)
+        servers.append(server)
+        return server.start()
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cassette_keys_ignore_the_user_and_key_order():
+    payload = ushiriki_api.create_payload(ACTIONS[:1])
+    body = json.dumps(dict(payload, userID='alice'))
+    other = json.dumps(dict(reversed(list(dict(payload, userID='bob').items()))))
+    assert Cassette.key('POST', '/p/', body) == Cassette.key('POST', '/p/', other)
+    assert Cassette.key('POST', '/p/', body) != Cassette.key(
+        'POST', '/p/', json.dumps(ushiriki_api.create_payload(ACTIONS[1:2])))
+
+
+def test_simulated_rewards_match_the_local_env(serve):
+    baseuri = serve(mode='simulate')
+    expected = LocalUshirikiEnvironment().evaluate_actions_batch(np.array([ACTIONS]))[0]
+
+    rewards = [evaluate(baseuri, ACTIONS[:year]) for year in range(1, 6)]
+    np.testing.assert_allclose(rewards, expected)
+
+    # the reward can also be fetched by id in the path
+    _, body = request(baseuri, ushiriki_api.CREATE_PATH,
+                      ushiriki_api.create_payload(ACTIONS[:2]))
+    _, body = request(baseuri, '{}/{}'.format(
+        ushiriki_api.REWARD_PATH, ushiriki_api.parse_data(body)))
+    assert ushiriki_api.parse_data(body) == pytest.approx(expected[1])
+
+
+def test_bad_requests_are_answered_with_a_status_code(serve):
+    baseuri = serve(mode='simulate')
+
+    # a series must start at year 1
+    status, body = request(baseuri, ushiriki_api.CREATE_PATH, {'actionSeries': [
+        {'time': 2, 'ITN': .5, 'IRS': .2}]})
+    assert status == 400 and body['statusCode'] == 400
+
+    status, body = request(baseuri, ushiriki_api.REWARD_PATH,
+                           ushiriki_api.reward_payload('missing'))
+    assert status == 404 and body['statusCode'] == 404
+    with pytest.raises(ValueError):
+        ushiriki_api.parse_data(body)
+
+
+def test_replay_serves_recordings_of_another_user(tmp_path, serve):
+    cassette = str(tmp_path / 'cassette.jsonl')
+    recorder = Cassette(cassette)
+    recorder.append(
+        Cassette.key('POST', ushiriki_api.CREATE_PATH, json.dumps(
+            dict(ushiriki_api.create_payload(ACTIONS[:1]), userID='alice'))),
+        200, ushiriki_api.response('job-1'))
+    recorder.append(
+        Cassette.key('POST', ushiriki_api.REWARD_PATH,
+                     json.dumps(ushiriki_api.reward_payload('job-1'))),
+        200, ushiriki_api.response(1.5))
+
+    baseuri = serve(mode='replay', cassette=cassette)
+    assert evaluate(baseuri, ACTIONS[:1]) == 1.5
+
+
+def test_challenge_environment_runs_against_the_server(serve):
+    pytest.importorskip('ushiriki_policy_engine_library')
+    from ushiriki.infrastructure.custom_ushiriki_env import CustomUshirikiEnvironment
+
+    baseuri = serve(mode='simulate')
+    expected = LocalUshirikiEnvironment().evaluate_actions_batch(np.array([ACTIONS]))[0]
+
+    env = CustomUshirikiEnvironment(baseuri=baseuri)
+    env.reset()
+    rewards = []
+    for ac in ACTIONS:
+        _, rew, done, _ = env.step(ac)
+        rewards.append(rew)
+    assert done
+    np.testing.assert_allclose(rewards, expected, rtol=1e-6)
+
+    policy = {str(year): ac for year, ac in enumerate(ACTIONS, 1)}
+    assert env.evaluatePolicy(policy) == pytest.approx(expected.sum())